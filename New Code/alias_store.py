@@ -0,0 +1,143 @@
+import os
+import sys
+import json
+import hashlib
+
+from compile_cache import CACHE_DIR, write_atomic
+
+"""
+Alias table of resolved anti-preference names
+
+Misspelled bullet names are the same from run to run, so an AliasStore
+keeps every fuzzy match made (the raw string, the roster name and token
+it resolved to, its ratio and ambiguity flag) in ALIAS_FILE and later
+runs look them up directly instead of scoring the roster again.
+
+The table is keyed by a hash of the roster. When the roster changes,
+each entry is checked against the hash of its candidate set, the roster
+names that could score within the ambiguity margin of the cutoff (see
+IndexedFuzzyDict.candidates): the match of a name only changes when
+those do, so only those entries are dropped and resolved again.
+
+Entries can be reviewed and overridden, which takes the place of the
+hand-kept `fixers` dict of Old Code/process3.py:
+python alias_store.py                          # list the table
+python alias_store.py set "Jon Smtih" "Jon Smith"   # resolve a raw name to a roster name
+python alias_store.py remove "Jon Smtih"       # forget an entry or override
+Overrides are kept until their roster name leaves the roster.
+"""
+
+ALIAS_FILE = os.path.join(CACHE_DIR, 'aliases.json')
+# bump when the layout of the table changes
+ALIAS_VERSION = 1
+
+
+def _digest(value):
+    return hashlib.sha256(repr(value).encode()).hexdigest()[:20]
+
+
+def roster_hash(fuzzy, margin):
+    """Hash of the (name, token) pairs of a roster, in order, its cutoff and the ambiguity margin"""
+    return _digest((fuzzy.cutoff, margin, list(fuzzy.items())))
+
+
+class AliasStore(object):
+    """Raw name to (roster name, token) table, loaded from and saved to path"""
+
+    def __init__(self, path=ALIAS_FILE):
+        self.path = path
+        self.roster = None
+        self.aliases = {}
+        self.hits = 0
+        self.dropped = 0
+        if os.path.isfile(path):
+            with open(path) as f:
+                table = json.load(f)
+            if table.get('version') == ALIAS_VERSION:
+                self.roster = table['roster']
+                self.aliases = table['aliases']
+
+    def validate(self, fuzzy, margin):
+        """Checks the table against a roster, dropping entries whose candidates changed
+
+        margin is the ambiguity margin the matches were flagged with.
+        Overrides get the current token of their roster name.
+        """
+        current = roster_hash(fuzzy, margin)
+        if current == self.roster:
+            return
+        for (raw, entry) in list(self.aliases.items()):
+            if entry['override']:
+                keep = entry['name'] in fuzzy.keys()
+                if keep:
+                    entry['token'] = fuzzy[entry['name']]
+            else:
+                keep = entry['candidates'] == self.candidate_hash(fuzzy, raw, margin)
+            if not keep:
+                del self.aliases[raw]
+                self.dropped += 1
+        self.roster = current
+
+    @staticmethod
+    def candidate_hash(fuzzy, raw, margin):
+        """Hash of the roster names raw can match or be ambiguous with"""
+        return _digest((fuzzy.cutoff, margin, fuzzy.candidates(raw, fuzzy.cutoff - margin)))
+
+    def get(self, raw):
+        """Returns (roster name, token, ratio, ambiguous) of raw, None if it is not in the table"""
+        entry = self.aliases.get(raw)
+        if entry is None:
+            return None
+        self.hits += 1
+        return entry['name'], entry['token'], entry['ratio'], entry['ambiguous']
+
+    def record(self, raw, name, token, ratio, ambiguous, candidates):
+        """Adds the fuzzy match of raw, with the candidate_hash it was made with"""
+        if raw in self.aliases and self.aliases[raw]['override']:
+            return
+        self.aliases[raw] = {'name': name, 'token': token, 'ratio': ratio, 'ambiguous': ambiguous,
+                             'candidates': candidates, 'override': False}
+
+    def override(self, raw, name):
+        """Resolves raw to roster name from now on; the token is filled in by validate"""
+        self.aliases[raw] = {'name': name, 'token': None, 'ratio': 1.0, 'ambiguous': False,
+                             'candidates': None, 'override': True}
+        # make the next validate look up the token
+        self.roster = None
+
+    def remove(self, raw):
+        self.aliases.pop(raw, None)
+
+    def overrides(self):
+        """Returns the overrides as a sorted list of (raw, roster name)"""
+        return sorted((raw, entry['name']) for (raw, entry) in self.aliases.items() if entry['override'])
+
+    def save(self):
+        """Writes the table to path"""
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        table = {'version': ALIAS_VERSION, 'roster': self.roster, 'aliases': self.aliases}
+        write_atomic(self.path, lambda f: json.dump(table, f, indent=1, sort_keys=True))
+
+    def summary(self):
+        return ('Alias table: {entries} entries, {overrides} overrides, {hits} looked up, '
+                '{dropped} dropped for a changed roster'.format(entries=len(self.aliases),
+                                                                overrides=len(self.overrides()),
+                                                                hits=self.hits, dropped=self.dropped))
+
+
+if __name__ == '__main__':
+    store = AliasStore()
+    if sys.argv[1:2] == ['set'] and len(sys.argv) == 4:
+        store.override(sys.argv[2], sys.argv[3])
+        store.save()
+    elif sys.argv[1:2] == ['remove'] and len(sys.argv) == 3:
+        store.remove(sys.argv[2])
+        store.save()
+    elif len(sys.argv) > 1:
+        print('Usage: python alias_store.py [set RAW NAME | remove RAW]')
+        sys.exit(1)
+    for (raw, entry) in sorted(store.aliases.items()):
+        flags = ' (override)' if entry['override'] else ' (ambiguous)' if entry['ambiguous'] else ''
+        print('%-30r -> %-30s %-12s ratio %.2f%s' % (raw, entry['name'], entry['token'], entry['ratio'], flags))
@@ -0,0 +1,53 @@
+import numpy as np
+
+"""
+Clique cover of the anti-preference conflict graph
+
+Every bullet (i names k) is an edge of an undirected conflict graph on
+the students. Mutual bullets give the same edge twice and a group of
+students who all named each other gives a clique. Instead of one row
+x[i,j] + x[k,j] <= 1 per edge and project, a clique C needs a single
+row sum_{i in C} x[i,j] <= 1 per project, which is also a tighter LP
+relaxation than its pair rows.
+"""
+
+
+def conflict_edges(pairs):
+    """Returns the distinct undirected edges (i < k) of the (shooter, target) pairs"""
+    pairs = np.asarray(pairs, dtype=int).reshape(-1, 2)
+    pairs = pairs[pairs[:, 0] != pairs[:, 1]]
+    edges = np.sort(pairs, axis=1)
+    if len(edges) == 0:
+        return edges
+    return np.unique(edges, axis=0)
+
+
+def clique_cover(edges):
+    """Greedily covers every edge with a clique, returns a list of student index arrays
+
+    Each uncovered edge starts a clique that is grown by the common
+    neighbour with the most uncovered edges into it, so large clusters end
+    up in one clique and every edge is in at least one.
+    """
+    neighbours = {}
+    for (i, k) in edges:
+        neighbours.setdefault(i, set()).add(k)
+        neighbours.setdefault(k, set()).add(i)
+    uncovered = set(map(tuple, np.asarray(edges).tolist()))
+
+    cliques = []
+    for (i, k) in np.asarray(edges).tolist():
+        if (i, k) not in uncovered:
+            continue
+        clique = [i, k]
+        common = neighbours[i] & neighbours[k]
+        while common:
+            # prefer the neighbour that covers the most new edges
+            best = max(sorted(common), key=lambda v: sum((min(u, v), max(u, v)) in uncovered for u in clique))
+            clique.append(best)
+            common &= neighbours[best]
+        for a in range(len(clique)):
+            for b in range(a + 1, len(clique)):
+                uncovered.discard((min(clique[a], clique[b]), max(clique[a], clique[b])))
+        cliques.append(np.array(sorted(clique)))
+    return cliques
@@ -0,0 +1,120 @@
+import os
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from fuzzy3 import IndexedFuzzyDict
+from kbest import forks_workers
+
+"""
+Bulk resolution of anti-preference names
+
+The survey's bullet columns hold names as the students typed them. Rather
+than looking each one up in the roster's fuzzy dictionary in turn,
+resolve_bullets collects every bullet, resolves each distinct string
+once (exact roster names directly, the rest by similarity scoring, on a
+process pool for large surveys) and returns the anti-preferences as an
+edge list: shooter row, target row, bullet slot, match ratio and whether
+the match is ambiguous, i.e. a different student's name scores within
+AMBIGUITY_MARGIN of the best one. The matches are the ones a lookup in
+the fuzzy dictionary returns. With an AliasStore (see alias_store.py)
+names matched on an earlier run are not scored again.
+"""
+
+# a match is ambiguous when another student's name scores within this much of it
+AMBIGUITY_MARGIN = 0.05
+# resolve on a process pool only with at least this many names left to score
+POOL_MIN_NAMES = 200
+
+# dtype of the edge list returned by resolve_bullets
+EDGE_DTYPE = np.dtype([('shooter', np.int64), ('target', np.int64), ('slot', np.int64),
+                       ('ratio', np.float64), ('ambiguous', np.bool_)])
+
+# roster of each pool worker, set once by _init_worker
+_worker_roster = None
+
+
+def _init_worker(items, cutoff):
+    global _worker_roster
+    _worker_roster = IndexedFuzzyDict(items, cutoff=cutoff)
+
+
+def _resolve_chunk(names, roster=None, margin=AMBIGUITY_MARGIN):
+    """Returns (key, value, ratio, ambiguous) for every name, key and value None below the cutoff"""
+    roster = _worker_roster if roster is None else roster
+    resolved = []
+    for name in names:
+        found = roster.matches(name, count=2)
+        if not found or found[0][2] < roster.cutoff:
+            resolved.append((None, None, found[0][2] if found else 0.0, False))
+            continue
+        (key, value, ratio) = found[0]
+        ambiguous = any(other != value and ratio - other_ratio <= margin for (_, other, other_ratio) in found[1:])
+        resolved.append((key, value, ratio, ambiguous))
+    return resolved
+
+
+def resolve_names(names, fuzzy, workers=None, aliases=None):
+    """Resolves every distinct name against an IndexedFuzzyDict
+
+    Returns a dict from name to (key, value, ratio, ambiguous), key and
+    value None where no roster name reaches the cutoff. workers is the
+    number of processes, None for one per CPU; the names are scored in
+    this process where workers are not forked (see
+    kbest.forks_workers). Names in the AliasStore
+    aliases are taken from it and new fuzzy matches are added to it.
+    """
+    if aliases is not None:
+        aliases.validate(fuzzy, AMBIGUITY_MARGIN)
+    resolved = {}
+    pending = []
+    for name in dict.fromkeys(names):
+        alias = aliases.get(name) if aliases is not None else None
+        if alias is not None:
+            resolved[name] = alias
+        elif fuzzy._dict_contains(name):
+            resolved[name] = (name, fuzzy._dict_getitem(name), 1.0, False)
+        else:
+            pending.append(name)
+
+    workers = os.cpu_count() if workers is None else workers
+    if workers > 1 and len(pending) >= POOL_MIN_NAMES and forks_workers():
+        chunks = [pending[k::workers] for k in range(workers)]
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(list(fuzzy.items()), fuzzy.cutoff)) as pool:
+            for (chunk, results) in zip(chunks, pool.map(_resolve_chunk, chunks)):
+                resolved.update(zip(chunk, results))
+    else:
+        resolved.update(zip(pending, _resolve_chunk(pending, fuzzy)))
+
+    if aliases is not None:
+        for name in pending:
+            (key, value, ratio, ambiguous) = resolved[name]
+            if key is not None:
+                aliases.record(name, key, value, ratio, ambiguous,
+                               aliases.candidate_hash(fuzzy, name, AMBIGUITY_MARGIN))
+    return resolved
+
+
+def resolve_bullets(bullets, fuzzy, token_index, workers=None, aliases=None):
+    """Resolves an n x slots array of anti-preference names, None where blank, to an edge list
+
+    fuzzy maps roster names to tokens and token_index tokens to rows,
+    aliases is an optional AliasStore (see resolve_names). Returns a
+    structured array of EDGE_DTYPE in row and slot order.
+    Raises KeyError naming every bullet that matches no student.
+    """
+    shooters, slots = np.nonzero(np.not_equal(bullets, None))
+    names = bullets[shooters, slots].tolist()
+    resolved = resolve_names(names, fuzzy, workers, aliases)
+
+    unmatched = sorted(set(name for name in names if resolved[name][1] is None))
+    if unmatched:
+        raise KeyError('no student matches the anti-preferences ' + ', '.join(map(repr, unmatched)))
+
+    edges = np.zeros(len(names), dtype=EDGE_DTYPE)
+    edges['shooter'] = shooters
+    edges['slot'] = slots
+    edges['target'] = [token_index[resolved[name][1]] for name in names]
+    edges['ratio'] = [resolved[name][2] for name in names]
+    edges['ambiguous'] = [resolved[name][3] for name in names]
+    return edges
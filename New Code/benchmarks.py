@@ -0,0 +1,603 @@
+import os
+import sys
+import time
+import tempfile
+import numpy as np
+import pandas as pd
+
+from fuzzy3 import FuzzyDict, IndexedFuzzyDict
+from optimizeIP_repeat import optimize_repeat
+from optimizeIP_matrix import build_matrix_model, optimize_matrix
+from solver_backends import BACKENDS, get_backend
+from enumerate_solutions import cut_loop, diverse_loop
+from min_cost_flow import solve_flow
+from lazy_antiprefs import LazyAntiprefs
+from kbest import kbest
+from diversity import hamming_matrix, hamming_distances, comembership_matrix, DiverseSelector, StreamingDiverseSet
+from lagrangian import solve_lagrangian
+from lp_rounding import solve_lp_rounding
+from ingest import read_cohort
+from antipref_resolution import resolve_bullets
+from alias_store import AliasStore
+
+"""
+Benchmarks on synthetic cohorts
+
+To run:
+python benchmarks.py build
+python benchmarks.py backends
+python benchmarks.py enumerate
+python benchmarks.py flow
+python benchmarks.py lagrangian
+python benchmarks.py lazy
+python benchmarks.py cliques
+python benchmarks.py sparse
+python benchmarks.py kbest
+python benchmarks.py distance
+python benchmarks.py diverse
+python benchmarks.py hamming
+python benchmarks.py streaming
+python benchmarks.py comembership
+python benchmarks.py lp
+python benchmarks.py ingest
+python benchmarks.py fuzzy
+python benchmarks.py bulk
+python benchmarks.py cache
+"""
+
+# penalties for preference codes 1-5, as in optimizeIP_picos.py
+PREF_COSTS = np.array([0, 10000, 1000, 5, 1, 0])
+
+
+def random_instance(num_students, num_projects, antipref_rate=0.3, low_gpa_rate=0.2, seed=0):
+    """Returns the optimize_repeat arguments for a random feasible cohort"""
+    rng = np.random.RandomState(seed)
+
+    project_names = ['Project %d' % j for j in range(num_projects)]
+    project_index = dict((name, j) for j, name in enumerate(project_names))
+    tokens = ['T%06d' % i for i in range(num_students)]
+    token_index = dict((token, i) for i, token in enumerate(tokens))
+    name_fuzzy = FuzzyDict(cutoff=0.6)
+    for token in tokens:
+        name_fuzzy['Student ' + token] = token
+
+    # preference codes skewed towards the middle of the scale
+    codes = rng.choice([1, 2, 3, 3, 4, 4, 5], size=(num_students, num_projects))
+    penalties = PREF_COSTS[codes]
+
+    # staffing bounds that bracket an even split
+    size = num_students // num_projects
+    minstaff_projects = dict((name, size - 1) for name in project_names)
+    maxstaff_projects = dict((name, size + 2) for name in project_names)
+
+    # each student names up to two others
+    antiprefs_dict_1 = {}
+    antiprefs_dict_2 = {}
+    for i in range(num_students):
+        if rng.rand() < antipref_rate:
+            antiprefs_dict_1[i] = (i + rng.randint(1, num_students)) % num_students
+            if rng.rand() < 0.5:
+                antiprefs_dict_2[i] = (i + rng.randint(1, num_students)) % num_students
+    stu_gpa_indic = (rng.rand(num_students) < low_gpa_rate).astype(int).tolist()
+
+    locked_students = [('Student ' + tokens[0], project_names[0])]
+    barred_students = [('Student ' + tokens[1], project_names[0])]
+
+    return (project_index, token_index, name_fuzzy, penalties, minstaff_projects, maxstaff_projects,
+            antiprefs_dict_1, antiprefs_dict_2, stu_gpa_indic, locked_students, barred_students, [])
+
+
+def clustered_instance(num_students, num_projects, cluster_rate=0.6, seed=0):
+    """Returns random_instance arguments where groups of three students all named each other"""
+    args = list(random_instance(num_students, num_projects, seed=seed))
+    rng = np.random.RandomState(seed + 1)
+    students = rng.permutation(num_students)[:int(cluster_rate*num_students)//3*3]
+    antiprefs_dict_1 = dict(args[6])
+    antiprefs_dict_2 = dict(args[7])
+    for group in students.reshape(-1, 3):
+        for k in range(3):
+            antiprefs_dict_1[group[k]] = group[(k + 1) % 3]
+            antiprefs_dict_2[group[k]] = group[(k + 2) % 3]
+    args[6], args[7] = antiprefs_dict_1, antiprefs_dict_2
+    return tuple(args)
+
+
+def timed(func, *args, **kwargs):
+    """Returns the result of func and the wall time it took"""
+    start = time.time()
+    result = func(*args, **kwargs)
+    return result, time.time() - start
+
+
+def bench_build():
+    """Model build time of optimize_repeat against the matrix builder"""
+    print('%8s %8s %10s %12s %12s %12s %14s' % ('students', 'projects', 'nonzeros', 'repeat (s)',
+                                                 'matrix (s)', 'picos (s)', 'us/nonzero'))
+    for (num_students, num_projects) in [(65, 13), (250, 25), (500, 50), (1000, 100), (2000, 200), (4000, 200)]:
+        args = random_instance(num_students, num_projects)
+        model, matrix_time = timed(build_matrix_model, *args)
+        _, picos_time = timed(optimize_matrix, *args)
+        # the per-expression builder is only timed where it finishes in reasonable time
+        if num_students*num_projects <= 10000:
+            _, repeat_time = timed(optimize_repeat, *args)
+            repeat_str = '%12.3f' % repeat_time
+        else:
+            repeat_str = '%12s' % '-'
+        print('%8d %8d %10d %s %12.3f %12.3f %14.3f' % (num_students, num_projects, model.nnz, repeat_str,
+                                                        matrix_time, picos_time, 1e6*matrix_time/model.nnz))
+
+
+def bench_backends(threads=1, time_limit=60):
+    """Solve time of each installed backend on the same instances"""
+    names = [name for name in sorted(BACKENDS.keys()) if BACKENDS[name].available()]
+    print('%8s %8s ' % ('students', 'projects') + ' '.join('%14s' % name for name in names))
+    for (num_students, num_projects) in [(65, 13), (150, 15), (300, 30), (600, 40)]:
+        model = build_matrix_model(*random_instance(num_students, num_projects))
+        cells = []
+        for name in names:
+            try:
+                result = get_backend(name, threads=threads, time_limit=time_limit).solve(model)
+            except Exception as error:
+                # e.g. size-limited licenses
+                print(name + ': ' + str(error).splitlines()[0])
+                cells.append('%14s' % 'error')
+                continue
+            cells.append('%8.3f %5s' % (result.solve_time, result.status[:5]))
+        print('%8d %8d ' % (num_students, num_projects) + ' '.join(cells))
+
+
+def bench_enumerate(backend_name='highs', limit=50):
+    """Wall time of the cut loop with and without a persistent session"""
+    print('%8s %8s %10s %14s %14s %10s' % ('students', 'projects', 'solutions', 'rebuild (s)',
+                                            'incremental (s)', 'solves'))
+    for (num_students, num_projects) in [(65, 13), (150, 15), (300, 30)]:
+        args = random_instance(num_students, num_projects)
+        times = []
+        for incremental in (False, True):
+            model = build_matrix_model(*args)
+            start = time.time()
+            results = [result for (_, result) in cut_loop(model, get_backend(backend_name), limit, incremental)]
+            times.append(time.time() - start)
+        # results without nodes were proven optimal by the warm start alone
+        solves = sum(1 for result in results if result.node_count != 0)
+        print('%8d %8d %10d %14.3f %14.3f %10d' % (num_students, num_projects, len(results),
+                                                   times[0], times[1], solves))
+
+
+def bench_flow(backend_name='highs'):
+    """Min-cost flow against the MIP solver on instances without side constraints"""
+    print('%8s %8s %12s %12s %10s' % ('students', 'projects', 'flow (s)', 'mip (s)', 'same obj'))
+    for (num_students, num_projects) in [(65, 13), (250, 25), (500, 50), (1000, 100), (4000, 200)]:
+        args = list(random_instance(num_students, num_projects, antipref_rate=0, low_gpa_rate=0))
+        model = build_matrix_model(*args)
+        flow_result = solve_flow(model)
+        mip_result = get_backend(backend_name).solve(model)
+        print('%8d %8d %12.4f %12.4f %10s' % (num_students, num_projects, flow_result.solve_time,
+                                              mip_result.solve_time,
+                                              flow_result.obj_value == mip_result.obj_value))
+
+
+def bench_lagrangian(backend_name='highs', time_limit=120):
+    """Lagrangian relaxation against the MIP solver: value, bound and time
+
+    The dense cohorts (every student naming others, half of them below
+    MIN_GPA) do not close the gap at the first iteration, so they exercise
+    the subgradient steps; the LP bound is the best bound they can reach.
+    The large sparse cohorts are where the relaxation beats the MIP solver.
+    """
+    print('%8s %8s %6s %10s %10s %10s %8s %10s %10s %10s' % ('students', 'projects', 'dense', 'lag value',
+                                                           'lag bound', 'lp bound', 'lag gap', 'lag (s)',
+                                                           'mip value', 'mip (s)'))
+    for (num_students, num_projects, dense, seed) in [(65, 13, False, 0), (150, 15, False, 0), (300, 30, False, 0),
+                                                      (1000, 50, False, 0), (2000, 100, False, 0), (20, 4, True, 1),
+                                                      (65, 13, True, 1), (65, 13, True, 4), (150, 15, True, 1)]:
+        rates = dict(antipref_rate=1.0, low_gpa_rate=0.5) if dense else {}
+        model = build_matrix_model(*random_instance(num_students, num_projects, seed=seed, **rates))
+        lag_result = solve_lagrangian(model, time_limit=time_limit)
+        lp_result = solve_lp_rounding(model)
+        mip_result = get_backend(backend_name, time_limit=time_limit).solve(model)
+        print('%8d %8d %6s %10s %10.1f %10s %8s %10.3f %10s %10.3f' % (
+            num_students, num_projects, dense, lag_result.obj_value, lag_result.bound, lp_result.bound,
+            '-' if lag_result.gap is None else '%.2f%%' % (100*lag_result.gap), lag_result.solve_time,
+            mip_result.obj_value, mip_result.solve_time))
+
+
+def bench_lazy(backend_name='highs', limit=10):
+    """Full against lazily generated anti-preference rows, every student naming two others"""
+    print('%8s %8s %10s %10s %8s %12s %12s' % ('students', 'projects', 'full rows', 'lazy rows', 'rounds',
+                                                'full (s)', 'lazy (s)'))
+    for (num_students, num_projects) in [(65, 13), (300, 30), (1000, 50)]:
+        args = random_instance(num_students, num_projects, antipref_rate=1.0)
+        start = time.time()
+        model = build_matrix_model(*args)
+        list(cut_loop(model, get_backend(backend_name), limit))
+        full_time = time.time() - start
+        full_rows = len(model.block('antiprefs'))
+
+        start = time.time()
+        model = build_matrix_model(*args, lazy_antiprefs=True)
+        lazy = LazyAntiprefs(model)
+        list(cut_loop(model, get_backend(backend_name), limit, lazy=lazy))
+        lazy_time = time.time() - start
+        print('%8d %8d %10d %10d %8d %12.3f %12.3f' % (num_students, num_projects, full_rows, lazy.rows_added,
+                                                       lazy.rounds, full_time, lazy_time))
+
+
+def bench_cliques(backend_name='highs', threads=1):
+    """Pairwise against clique anti-preference rows: rows, branch-and-bound nodes and time"""
+    print('%8s %8s %10s %10s %10s %10s %10s %10s %8s' % ('students', 'projects', 'pair rows', 'clique rows',
+                                                         'pair nodes', 'clq nodes', 'pair (s)', 'clique (s)',
+                                                         'same obj'))
+    for (num_students, num_projects) in [(65, 13), (150, 15), (300, 30), (600, 40)]:
+        args = clustered_instance(num_students, num_projects)
+        results = []
+        for cliques in (False, True):
+            model = build_matrix_model(*args, antipref_cliques=cliques)
+            results.append((len(model.block('antiprefs')),
+                            get_backend(backend_name, threads=threads, mip_gap=0).solve(model)))
+        ((pair_rows, pair), (clique_rows, clique)) = results
+        print('%8d %8d %10d %10d %10s %10s %10.3f %10.3f %8s' % (num_students, num_projects, pair_rows, clique_rows,
+                                                                 pair.node_count, clique.node_count,
+                                                                 pair.solve_time, clique.solve_time,
+                                                                 pair.obj_value == clique.obj_value))
+
+
+def bench_sparse(backend_name='highs', ban_rate=0.2, citizen_projects=0.3):
+    """Columns and solve time as bans and the 10000-cost threshold remove pairs"""
+    print('%8s %8s %10s %10s %10s %12s %12s %10s' % ('students', 'projects', 'all pairs', 'allowed',
+                                                     'max 10000', 'allowed (s)', 'max (s)', 'same obj'))
+    for (num_students, num_projects) in [(250, 25), (1000, 50), (2000, 100)]:
+        args = list(random_instance(num_students, num_projects))
+        rng = np.random.RandomState(1)
+        # non-citizens are banned from the projects that require citizenship
+        tokens = sorted(args[1].keys())
+        projects = sorted(args[0].keys())
+        restricted = rng.rand(num_projects) < citizen_projects
+        args[11] = [(tokens[i], projects[j]) for i in np.flatnonzero(rng.rand(num_students) < ban_rate)
+                    for j in np.flatnonzero(restricted)]
+        results = []
+        # as a string, the way MAX_PREF_COST = PREF_COST_1 passes it
+        for max_cost in (None, str(PREF_COSTS[1])):
+            model = build_matrix_model(*args, max_cost=max_cost)
+            results.append((model.num_x, get_backend(backend_name).solve(model)))
+        ((allowed, full), (cheap, dropped)) = results
+        print('%8d %8d %10d %10d %10d %12.3f %12.3f %10s' % (num_students, num_projects, num_students*num_projects,
+                                                             allowed, cheap, full.solve_time, dropped.solve_time,
+                                                             full.obj_value == dropped.obj_value))
+
+
+def bench_kbest(backend_name='highs', limit=20, worker_counts=(1, 2, 4, 8)):
+    """Partitioned k-best on a growing process pool against the incremental cut loop
+
+    The search is timed without kbest's fallback, which runs the cut loop
+    with more workers than CPUs.
+    """
+    print('%8s %8s %10s ' % ('students', 'projects', 'cut (s)') +
+          ' '.join('%10s' % ('%d proc (s)' % workers) for workers in worker_counts) + ' %10s' % 'same objs')
+    for (num_students, num_projects) in [(65, 13), (150, 15)]:
+        args = random_instance(num_students, num_projects)
+        start = time.time()
+        cut_values = [result.obj_value for (_, result) in
+                      cut_loop(build_matrix_model(*args), get_backend(backend_name, mip_gap=0), limit)]
+        cells = ['%10.3f' % (time.time() - start)]
+        same = True
+        for workers in worker_counts:
+            start = time.time()
+            values = [result.obj_value for (_, result) in
+                      kbest(build_matrix_model(*args), get_backend(backend_name, mip_gap=0, threads=1), limit,
+                            workers, fallback=False)]
+            cells.append('%10.3f' % (time.time() - start))
+            same = same and np.allclose(values, cut_values)
+        print('%8d %8d ' % (num_students, num_projects) + ' '.join(cells) + ' %10s' % same)
+
+
+def bench_distance(backend_name='highs', num_diverse=10, enumerate_limit=100):
+    """Solves and time to get num_diverse options: distance cuts against enumerate-then-filter"""
+    print('%8s %8s %10s %8s %10s %12s %12s' % ('students', 'projects', 'distance', 'solves', 'time (s)',
+                                               'min pair dist', 'worst obj'))
+    for (num_students, num_projects) in [(65, 13), (150, 15)]:
+        args = random_instance(num_students, num_projects)
+        for min_distance in (1, 3, 5, 10):
+            # distance 1 is the current flow: enumerate_limit solutions, keep the most diverse
+            limit = enumerate_limit if min_distance == 1 else num_diverse
+            start = time.time()
+            solutions = list(cut_loop(build_matrix_model(*args), get_backend(backend_name), limit,
+                                      min_distance=min_distance))
+            elapsed = time.time() - start
+            assignments = [assignment for (assignment, _) in solutions]
+            if min_distance == 1:
+                # greedy max-min selection (DivResults uses DIVERSE_OBJECTIVE, max-sum by default)
+                chosen = [0]
+                while len(chosen) < min(num_diverse, len(assignments)):
+                    chosen.append(max(range(len(assignments)),
+                                      key=lambda k: min(np.sum(assignments[k] != assignments[c]) for c in chosen)))
+                assignments = [assignments[k] for k in chosen]
+                solutions = [solutions[k] for k in chosen]
+            distances = [np.sum(a != b) for (k, a) in enumerate(assignments) for b in assignments[k+1:]]
+            print('%8d %8d %10d %8d %10.3f %12d %12.0f' % (num_students, num_projects, min_distance, limit, elapsed,
+                                                          min(distances),
+                                                          max(result.obj_value for (_, result) in solutions)))
+
+
+def bench_diverse(backend_name='highs', num_diverse=10, gaps=(0.01, 0.05, 0.1)):
+    """Pairwise distances of num_diverse solutions within a gap of the optimum, from diverse_loop"""
+    print('%8s %8s %8s %10s %12s %12s %12s' % ('students', 'projects', 'gap', 'time (s)', 'min pair dist',
+                                               'mean dist', 'worst obj'))
+    for (num_students, num_projects) in [(65, 13), (150, 15)]:
+        args = random_instance(num_students, num_projects)
+        for gap in gaps:
+            start = time.time()
+            solutions = list(diverse_loop(build_matrix_model(*args), get_backend(backend_name), num_diverse, gap))
+            elapsed = time.time() - start
+            assignments = [assignment for (assignment, _) in solutions]
+            distances = [np.sum(a != b) for (k, a) in enumerate(assignments) for b in assignments[k+1:]]
+            print('%8d %8d %8.2f %10.3f %12d %12.1f %12.0f' % (num_students, num_projects, gap, elapsed,
+                                                              min(distances), np.mean(distances),
+                                                              max(result.obj_value for (_, result) in solutions)))
+
+
+def bench_hamming(num_students=150, num_projects=15, block_size=2048):
+    """Distance matrix of a pool of K solutions: pairwise Python loop against hamming_matrix"""
+    print('%8s %12s %12s %8s' % ('K', 'loop (s)', 'blocked (s)', 'same'))
+    rng = np.random.RandomState(0)
+    for K in (100, 1000, 10000):
+        # solutions near a common optimum, like an enumerated pool
+        pool = np.tile(rng.randint(num_projects, size=num_students), (K, 1))
+        moved = rng.rand(K, num_students) < 0.3
+        pool[moved] = rng.randint(num_projects, size=moved.sum())
+        start = time.time()
+        dist = hamming_matrix(pool, block_size)
+        blocked = time.time() - start
+        if K <= 1000:
+            start = time.time()
+            loop = np.zeros((K, K), dtype=int)
+            for r in range(K):
+                for c in range(r+1, K):
+                    loop[r, c] = loop[c, r] = sum(pool[r, i] != pool[c, i] for i in range(num_students))
+            print('%8d %12.3f %12.3f %8s' % (K, time.time() - start, blocked, np.array_equal(loop, dist)))
+        else:
+            # too many pairs for the loop: check a sample of rows against hamming_distances
+            rows = rng.choice(K, 100, replace=False)
+            same = all(np.array_equal(dist[r], hamming_distances(pool, pool[r])) for r in rows)
+            print('%8d %12s %12.3f %8s' % (K, '-', blocked, same))
+
+
+def bench_streaming(num_students=150, num_projects=15, size=10):
+    """Diverse set of an arriving pool: streaming swaps against greedy selection from the full matrix"""
+    print('%8s %10s %12s %12s %12s %12s' % ('K', 'objective', 'greedy (s)', 'stream (s)', 'greedy value',
+                                             'stream value'))
+    rng = np.random.RandomState(0)
+    for K in (1000, 5000):
+        pool = np.tile(rng.randint(num_projects, size=num_students), (K, 1))
+        moved = rng.rand(K, num_students) < 0.1
+        pool[moved] = rng.randint(num_projects, size=moved.sum())
+        for objective in ('max_sum', 'max_min'):
+            start = time.time()
+            chosen = DiverseSelector(hamming_matrix(pool), objective).select(size)
+            greedy = time.time() - start
+            start = time.time()
+            stream = StreamingDiverseSet(size, objective)
+            for (index, assignment) in enumerate(pool):
+                stream.add(index, assignment)
+            streaming = time.time() - start
+            values = []
+            for indices in (chosen, stream.indices):
+                dist = hamming_matrix(pool[indices])
+                values.append(dist.sum()//2 if objective == 'max_sum' else dist[~np.eye(size, dtype=bool)].min())
+            print('%8d %10s %12.3f %12.3f %12d %12d' % (K, objective, greedy, streaming, values[0], values[1]))
+
+
+def bench_comembership(num_students=150, num_projects=15):
+    """Co-membership distance matrix of a pool of K solutions, and how its picks differ from Hamming's"""
+    print('%8s %12s %14s %16s' % ('K', 'matrix (s)', 'same picks', 'mean pair dist'))
+    rng = np.random.RandomState(0)
+    for K in (1000, 3000, 5000):
+        pool = np.tile(rng.randint(num_projects, size=num_students), (K, 1))
+        moved = rng.rand(K, num_students) < 0.1
+        pool[moved] = rng.randint(num_projects, size=moved.sum())
+        start = time.time()
+        dist = comembership_matrix(pool)
+        elapsed = time.time() - start
+        chosen = DiverseSelector(dist).select(10)
+        same = len(set(chosen) & set(DiverseSelector(hamming_matrix(pool)).select(10)))
+        print('%8d %12.3f %14d %16.1f' % (K, elapsed, same, dist[np.ix_(chosen, chosen)].sum()/90.0))
+
+
+def bench_lp(backend_name='highs', time_limit=60):
+    """LP rounding against the MIP solver: value, LP bound and time"""
+    print('%8s %8s %9s %10s %10s %8s %10s %10s %10s' % ('students', 'projects', 'antiprefs', 'lp value',
+                                                       'lp bound', 'lp gap', 'lp (s)', 'mip value', 'mip (s)'))
+    for (num_students, num_projects) in [(65, 13), (150, 15), (300, 30)]:
+        for antipref_rate in (0.3, 0.7):
+            model = build_matrix_model(*random_instance(num_students, num_projects, antipref_rate=antipref_rate,
+                                                        low_gpa_rate=0.4, seed=3))
+            lp_result = solve_lp_rounding(model)
+            mip_result = get_backend(backend_name, time_limit=time_limit).solve(model)
+            print('%8d %8d %9.1f %10s %10s %8s %10.3f %10s %10.3f' % (
+                num_students, num_projects, antipref_rate, lp_result.obj_value, lp_result.bound,
+                '-' if lp_result.gap is None else '%.2f%%' % (100*lp_result.gap), lp_result.solve_time,
+                mip_result.obj_value, mip_result.solve_time))
+
+
+def write_cohort(directory, num_students, num_projects, seed=0):
+    """Writes a random survey.csv and students.csv to directory, returns their paths"""
+    rng = np.random.RandomState(seed)
+    tokens = ['T%06d' % i for i in range(num_students)]
+    names = ['Student%d Last%d' % (i, i) for i in range(num_students)]
+    survey = pd.DataFrame(rng.choice([1, 2, 3, 3, 4, 4, 5], size=(num_students, num_projects)),
+                          columns=['project [%d]' % (j + 1) for j in range(num_projects)], index=tokens)
+    named = rng.rand(num_students) < 0.3
+    survey['bullets [1]'] = np.where(named, [names[k] for k in rng.randint(num_students, size=num_students)], '')
+    survey['bullets [2]'] = ''
+    survey.index.name = 'Token'
+    students = pd.DataFrame({'First Name': [' ' + name.split()[0] for name in names],
+                             'Last Name': [name.split()[1] + ' ' for name in names],
+                             'Cumulative GPA': rng.uniform(2.3, 4.0, size=num_students).round(3)}, index=tokens)
+    students.index.name = 'ID Number'
+    # students in a different order from the survey
+    students = students.iloc[rng.permutation(num_students)]
+    paths = (os.path.join(directory, 'survey.csv'), os.path.join(directory, 'students.csv'))
+    survey.to_csv(paths[0])
+    students.to_csv(paths[1])
+    return paths
+
+
+def bench_ingest(num_projects=13):
+    """Reading and penalty matrix: the cell-by-cell loop against read_cohort"""
+    penalty_dict = dict(zip(range(1, 6), map(str, PREF_COSTS[1:])))
+    cols = ['project [%d]' % (j + 1) for j in range(num_projects)]
+    print('%8s %10s %12s %8s' % ('students', 'loop (s)', 'ingest (s)', 'same'))
+    directory = tempfile.mkdtemp()
+    for num_students in (100, 1000, 10000):
+        survey_file, student_file = write_cohort(directory, num_students, num_projects)
+        start = time.time()
+        df_survey = pd.read_csv(survey_file, index_col='Token', sep=',')
+        df_student = pd.read_csv(student_file, index_col='ID Number', sep=',')
+        df_student = df_student.apply(lambda x: x.str.strip() if x.dtype == 'object' else x)
+        token_index = dict()
+        for (i, (index, _)) in enumerate(df_student.iterrows()):
+            token_index[index] = i
+        penalties = np.zeros((num_students, num_projects))
+        for token in token_index:
+            for j in range(num_projects):
+                penalties[token_index[token], j] = penalty_dict[df_survey.at[token, cols[j]]]
+        loop = time.time() - start
+        start = time.time()
+        cohort = read_cohort(survey_file, student_file, cols, penalty_dict)
+        print('%8d %10.3f %12.3f %8s' % (num_students, loop, time.time() - start,
+                                          np.array_equal(penalties, cohort.penalties)))
+
+
+def misspell(name, rng):
+    """Returns name with up to three random character edits, like a typed bullet"""
+    chars = list(name)
+    for _ in range(rng.randint(4)):
+        k = rng.randint(len(chars))
+        edit = rng.randint(3)
+        if edit == 0:
+            chars[k] = chr(ord('a') + rng.randint(26))
+        elif edit == 1 and len(chars) > 1:
+            del chars[k]
+        else:
+            chars.insert(k, chr(ord('a') + rng.randint(26)))
+    return ''.join(chars)
+
+
+def roster_names(num_names, rng):
+    """Returns num_names distinct 'First Last' names from small name pools, so many are similar"""
+    firsts = ['Lauren', 'Arpam', 'Ana', 'Ben', 'Cai', 'Dev', 'Eli', 'Fay', 'Gus', 'Hal', 'Ivy', 'Jon', 'Kim',
+              'Lee', 'Max', 'Ned', 'Oli', 'Pam', 'Quin', 'Rae']
+    lasts = ['Gullard', 'Rao', 'Smith', 'Jones', 'Brown', 'Lopez', 'Nguyen', 'Patel', 'Chen', 'Davis']
+    names = set()
+    while len(names) < num_names:
+        suffix = ''.join(chr(ord('a') + c) for c in rng.randint(26, size=rng.randint(1, 5)))
+        names.add('%s %s%s' % (firsts[rng.randint(len(firsts))], lasts[rng.randint(len(lasts))], suffix))
+    return sorted(names)
+
+
+def bench_fuzzy(lookups=50):
+    """Per-lookup time of misspelled names: FuzzyDict scan against IndexedFuzzyDict"""
+    print('%8s %14s %14s %8s' % ('names', 'scan (ms)', 'indexed (ms)', 'same'))
+    rng = np.random.RandomState(0)
+    for num_names in (100, 1000, 10000):
+        names = roster_names(num_names, rng)
+        queries = [misspell(names[k], rng) for k in rng.randint(num_names, size=lookups)]
+        plain, indexed = FuzzyDict(cutoff=0.6), IndexedFuzzyDict(cutoff=0.6)
+        for (k, name) in enumerate(names):
+            plain[name] = indexed[name] = k
+        indexed._search(queries[0])  # builds the index
+        start = time.time()
+        fast = [indexed._search(query) for query in queries]
+        indexed_time = (time.time() - start)/lookups
+        # the scan is slow, time it on fewer lookups
+        count = max(5, lookups*100//num_names)
+        start = time.time()
+        slow = [plain._search(query) for query in queries[:count]]
+        scan_time = (time.time() - start)/count
+        print('%8d %14.3f %14.3f %8s' % (num_names, 1000*scan_time, 1000*indexed_time, slow == fast[:count]))
+
+
+def bench_bulk(typo_share=0.3):
+    """Resolving every bullet of a survey: one lookup per bullet against resolve_bullets,
+    on a process pool and from an alias table filled by an earlier run"""
+    print('%8s %14s %14s %14s %14s %10s %8s' % ('students', 'lookups (s)', 'bulk (s)', 'pool (s)', 'aliased (s)',
+                                                 'ambiguous', 'same'))
+    rng = np.random.RandomState(0)
+    for num_names in (200, 1000, 4000):
+        names = roster_names(num_names, rng)
+        tokens = ['t%d' % k for k in range(num_names)]
+        token_index = dict(zip(tokens, range(num_names)))
+        bullets = np.empty((num_names, 2), dtype=object)
+        for (i, j) in zip(*np.nonzero(rng.rand(num_names, 2) < 0.8)):
+            name = names[rng.randint(num_names)]
+            bullets[i, j] = misspell(name, rng) if rng.rand() < typo_share else name
+
+        fuzzy = IndexedFuzzyDict(zip(names, tokens), cutoff=0.6)
+        start = time.time()
+        lookups = [token_index[fuzzy[name]] for name in bullets[np.not_equal(bullets, None)].tolist()]
+        lookup_time = time.time() - start
+        fuzzy = IndexedFuzzyDict(zip(names, tokens), cutoff=0.6)
+        start = time.time()
+        edges = resolve_bullets(bullets, fuzzy, token_index, workers=1)
+        bulk_time = time.time() - start
+        fuzzy = IndexedFuzzyDict(zip(names, tokens), cutoff=0.6)
+        start = time.time()
+        pooled = resolve_bullets(bullets, fuzzy, token_index)
+        pool_time = time.time() - start
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'aliases.json')
+            store = AliasStore(path)
+            resolve_bullets(bullets, IndexedFuzzyDict(zip(names, tokens), cutoff=0.6), token_index, 1, store)
+            store.save()
+            start = time.time()
+            aliased = resolve_bullets(bullets, IndexedFuzzyDict(zip(names, tokens), cutoff=0.6), token_index, 1,
+                                      AliasStore(path))
+            alias_time = time.time() - start
+        same = edges['target'].tolist() == lookups and (edges == pooled).all() and (edges == aliased).all()
+        print('%8d %14.3f %14.3f %14.3f %14.3f %10d %8s' % (num_names, lookup_time, bulk_time, pool_time, alias_time,
+                                                            edges['ambiguous'].sum(), same))
+
+
+def bench_cache(num_names=300, passes=20):
+    """Report-style lookups of every bullet once per solution, without and with the lookup cache"""
+    print('%18s %14s %14s %10s %8s' % ('dict', 'uncached (s)', 'cached (s)', 'hit rate', 'same'))
+    rng = np.random.RandomState(0)
+    names = roster_names(num_names, rng)
+    bullets = [misspell(names[k], rng) for k in rng.randint(num_names, size=num_names)]
+    for cls in (FuzzyDict, IndexedFuzzyDict):
+        times, found = [], []
+        for cache_size in (0, cls.CACHE_SIZE):
+            fuzzy = cls(zip(names, range(num_names)), cutoff=0.6)
+            fuzzy.CACHE_SIZE = cache_size
+            start = time.time()
+            found.append([[fuzzy[name] if name in fuzzy else None for name in bullets] for _ in range(passes)])
+            times.append(time.time() - start)
+        hit_rate = fuzzy.cache_hits/float(max(fuzzy.cache_hits + fuzzy.cache_misses, 1))
+        print('%18s %14.3f %14.3f %10.2f %8s' % (cls.__name__, times[0], times[1], hit_rate, found[0] == found[1]))
+
+
+BENCHMARKS = {'build': bench_build,
+              'backends': bench_backends,
+              'enumerate': bench_enumerate,
+              'flow': bench_flow,
+              'lagrangian': bench_lagrangian,
+              'lazy': bench_lazy,
+              'cliques': bench_cliques,
+              'sparse': bench_sparse,
+              'kbest': bench_kbest,
+              'distance': bench_distance,
+              'diverse': bench_diverse,
+              'hamming': bench_hamming,
+              'streaming': bench_streaming,
+              'comembership': bench_comembership,
+              'lp': bench_lp,
+              'ingest': bench_ingest,
+              'fuzzy': bench_fuzzy,
+              'bulk': bench_bulk,
+              'cache': bench_cache}
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(BENCHMARKS.keys())
+    for name in names:
+        print('== ' + name)
+        BENCHMARKS[name]()
@@ -0,0 +1,107 @@
+import os
+import hashlib
+import numpy as np
+import scipy.sparse as sp
+
+from optimizeIP_matrix import MatrixModel
+from solver_backends import HighsBackend
+
+"""
+Compile cache for built instances
+
+The first run for a set of inputs writes the compiled instance (penalty
+matrix, anti-preference edge lists, GPA flags, staffing bounds) and the
+MatrixModel to CACHE_DIR/<key>/, together with the model in MPS form
+for other tools. The key is a hash of the bytes of every input file and
+the repr of every constant that goes into the model, including those
+that decide which student a typed name resolves to, so changing a data
+file or a cost constant gives a new key and the stale entry is never
+read. Later runs with the same key load the arrays from instance.npz.
+"""
+
+CACHE_DIR = 'Cache'
+# bump when the cached layout or the model formulation changes
+CACHE_VERSION = 2
+
+
+def cache_key(files, constants):
+    """Hash of the input files' contents and a dict of constants"""
+    digest = hashlib.sha256()
+    digest.update(('version %d\n' % CACHE_VERSION).encode())
+    for path in files:
+        with open(path, 'rb') as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    for name in sorted(constants.keys()):
+        digest.update(('%s=%r\n' % (name, constants[name])).encode())
+    return digest.hexdigest()[:20]
+
+
+def write_atomic(path, write, mode='w'):
+    """Calls write on a file opened with mode and moves it to path
+
+    The data goes to path + '.partial' first and is renamed over path once
+    complete, so an interrupted run never leaves a truncated file behind.
+    """
+    with open(path + '.partial', mode) as f:
+        write(f)
+    os.replace(path + '.partial', path)
+
+
+def _model_arrays(model):
+    A = model.A.tocsr()
+    names = [name for (name, _, _) in model.row_blocks]
+    return {'model_shape': np.array([model.num_students, model.num_projects, model.num_vars]),
+            'model_col_index': model.col_index,
+            'model_obj': model.obj,
+            'model_obj_offset': np.array([model.obj_offset]),
+            'model_lb': model.lb,
+            'model_ub': model.ub,
+            'model_A_data': A.data,
+            'model_A_indices': A.indices,
+            'model_A_indptr': A.indptr,
+            'model_row_lo': model.row_lo,
+            'model_row_hi': model.row_hi,
+            'model_block_names': np.array(names, dtype=str),
+            'model_block_ranges': np.array([(start, stop) for (_, start, stop) in model.row_blocks],
+                                           dtype=int).reshape(-1, 2),
+            'model_antipref_pairs': model.antipref_pairs,
+            'model_fixed_project': model.fixed_project}
+
+
+def _load_model(arrays):
+    num_students, num_projects, num_vars = arrays['model_shape']
+    A = sp.csr_matrix((arrays['model_A_data'], arrays['model_A_indices'], arrays['model_A_indptr']),
+                      shape=(len(arrays['model_row_lo']), num_vars))
+    row_blocks = [(str(name), int(start), int(stop)) for (name, (start, stop)) in
+                  zip(arrays['model_block_names'], arrays['model_block_ranges'])]
+    return MatrixModel(int(num_students), int(num_projects), arrays['model_col_index'], arrays['model_obj'],
+                       arrays['model_lb'], arrays['model_ub'], A, arrays['model_row_lo'], arrays['model_row_hi'],
+                       row_blocks, arrays['model_antipref_pairs'], arrays['model_fixed_project'],
+                       float(arrays['model_obj_offset'][0]))
+
+
+def save_instance(key, instance, model, cache_dir=CACHE_DIR):
+    """Writes a dict of instance arrays and the model under key
+
+    The MPS file is only written when HiGHS is installed.
+    """
+    path = os.path.join(cache_dir, key)
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    arrays = dict(('instance_' + name, np.asarray(value)) for (name, value) in instance.items())
+    arrays.update(_model_arrays(model))
+    write_atomic(os.path.join(path, 'instance.npz'), lambda f: np.savez(f, **arrays), 'wb')
+    if HighsBackend.available():
+        HighsBackend().write_model(model, os.path.join(path, 'model.mps'))
+
+
+def load_instance(key, cache_dir=CACHE_DIR):
+    """Returns (instance dict, model) stored under key, or None if there is no entry"""
+    path = os.path.join(cache_dir, key, 'instance.npz')
+    if not os.path.isfile(path):
+        return None
+    with np.load(path) as arrays:
+        arrays = dict(arrays.items())
+    instance = dict((name[len('instance_'):], value) for (name, value) in arrays.items()
+                    if name.startswith('instance_'))
+    return instance, _load_model(arrays)
@@ -0,0 +1,305 @@
+import numpy as np
+
+"""
+Distances between the solutions in a pool
+
+A pool of K solutions is a K x num_students integer array of project
+indices. The Hamming distance between two solutions, the number of
+students on different projects, is num_students minus the number of
+(student, project) pairs they share. Writing every solution as a dense
+float32 0/1 row over the (student, project) pairs that occur in the
+pool, the shared pairs of all solutions in a block of rows against the
+whole pool are one BLAS product, so the distance matrix is filled block
+by block with about block_size x K numbers on top of the result and the
+rows.
+
+The co-membership distance counts the student pairs that are on one team
+in one solution but not in the other, the difference faculty notice when
+reading two allocations side by side; it ignores which project a team
+is on. Each solution is a float32 0/1 row over the student pairs that
+share a team in some solution of the pool, built once for the whole
+pool, and the pairs two solutions share come from the same blocked
+product. Solutions with the same teams (their team signature, the teams
+with projects relabelled in order of first appearance) are only
+compared once.
+
+DiverseSelector greedily picks a diverse subset from such a matrix,
+keeping the distance of every candidate to the picks so far up to date
+in O(K) per pick. StreamingDiverseSet keeps a diverse subset of fixed
+size while solutions arrive, without any K x K matrix: every newcomer
+is compared to the current members only and swapped in for the member
+whose removal improves the set most.
+"""
+
+# rows of the distance matrix computed per matrix product
+BLOCK_SIZE = 2048
+
+
+def _one_hot(pool):
+    """Returns the pool as dense float32 K x m 0/1 rows over the m (student, project) pairs it uses"""
+    K, n = pool.shape
+    pairs = np.arange(n)*(pool.max() + 1 if pool.size else 1) + pool
+    _, cols = np.unique(pairs, return_inverse=True)
+    rows = np.zeros((K, cols.max() + 1 if cols.size else 0), dtype=np.float32)
+    rows[np.repeat(np.arange(K), n), cols.ravel()] = 1
+    return rows
+
+
+def _fill_blocks(rows, block_size, dtype, distance):
+    """Returns the symmetric K x K matrix distance(shared, block, start) built block by block
+
+    shared is the product of the rows start:start+len(block) with the
+    rows from start on; only blocks on or right of the diagonal are
+    computed and the rest is mirrored.
+    """
+    K = rows.shape[0]
+    dist = np.zeros((K, K), dtype=dtype)
+    for start in range(0, K, block_size):
+        stop = min(start + block_size, K)
+        shared = rows[start:stop].dot(rows[start:].T)
+        shared = np.rint(shared).astype(np.int64)
+        block = distance(shared, start, stop)
+        dist[start:stop, start:] = block
+        dist[start:, start:stop] = block.T
+    return dist
+
+
+def hamming_distances(pool, assignment):
+    """Returns the Hamming distance of every row of pool to one assignment"""
+    return np.sum(np.asarray(pool) != np.asarray(assignment), axis=1)
+
+
+def hamming_matrix(pool, block_size=BLOCK_SIZE):
+    """Returns the symmetric K x K matrix of Hamming distances between the rows of pool
+
+    The entries use the smallest unsigned type that holds num_students.
+    """
+    pool = np.asarray(pool, dtype=int)
+    n = pool.shape[1]
+    # float32 counts are exact up to 2**24 students
+    return _fill_blocks(_one_hot(pool), block_size, np.min_scalar_type(n),
+                        lambda shared, start, stop: n - shared)
+
+
+def team_signatures(pool):
+    """Relabels the projects of every row of pool in order of first appearance
+
+    Two rows get the same signature exactly when they form the same teams.
+    """
+    pool = np.asarray(pool, dtype=int)
+    K, n = pool.shape
+    if pool.size == 0:
+        return pool.copy()
+    rows = np.repeat(np.arange(K), n)
+    first = np.full((K, pool.max() + 1), n)
+    np.minimum.at(first, (rows, pool.ravel()), np.tile(np.arange(n), K))
+    rank = np.empty_like(first)
+    np.put_along_axis(rank, np.argsort(first, axis=1, kind='stable'), np.arange(first.shape[1])[None, :], axis=1)
+    return rank[rows, pool.ravel()].reshape(K, n)
+
+
+def _pair_rows(pool):
+    """Returns dense float32 K x m 0/1 rows over the m student pairs i < l that share a team somewhere in pool"""
+    K, n = pool.shape
+    order = np.argsort(pool, axis=1, kind='stable')
+    labels = np.take_along_axis(pool, order, axis=1)
+    solution, code = [], []
+    # students d places apart in team order share a team when their labels agree
+    for d in range(1, n):
+        together = labels[:, :-d] == labels[:, d:]
+        if not together.any():
+            break
+        k, t = np.nonzero(together)
+        first, second = order[k, t], order[k, t + d]
+        solution.append(k)
+        code.append(np.minimum(first, second)*n + np.maximum(first, second))
+    solution = np.concatenate(solution + [np.zeros(0, dtype=int)])
+    code = np.concatenate(code + [np.zeros(0, dtype=int)])
+    # only pairs that occur get a column
+    _, cols = np.unique(code, return_inverse=True)
+    rows = np.zeros((K, cols.max() + 1 if cols.size else 0), dtype=np.float32)
+    rows[solution, cols.ravel()] = 1
+    return rows
+
+
+def comembership_distances(pool, assignment):
+    """Returns the co-membership distance of every row of pool to one assignment"""
+    pool = np.asarray(pool, dtype=int).reshape(-1, len(assignment))
+    assignment = np.asarray(assignment, dtype=int)
+    K = len(pool)
+    if K == 0:
+        return np.zeros(0, dtype=np.int64)
+    labels = max(pool.max(), assignment.max()) + 1
+    pairs = lambda counts: (counts*(counts - 1)//2).sum(axis=-1)
+    # students on one team in both solutions, per combination of their two teams
+    codes = (np.arange(K)*labels*labels)[:, None] + assignment[None, :]*labels + pool
+    both = np.bincount(codes.ravel(), minlength=K*labels*labels).reshape(K, -1)
+    own = np.array([pairs(np.bincount(row, minlength=labels)) for row in pool])
+    return own + pairs(np.bincount(assignment)) - 2*pairs(both)
+
+
+def comembership_matrix(pool, block_size=BLOCK_SIZE):
+    """Returns the symmetric K x K matrix of co-membership distances between the rows of pool"""
+    pool = np.asarray(pool, dtype=int)
+    K, n = pool.shape
+    # rows with the same teams share all distances
+    signatures, inverse = np.unique(team_signatures(pool), axis=0, return_inverse=True)
+    inverse = inverse.ravel()
+    pair_rows = _pair_rows(signatures)
+    together = pair_rows.sum(axis=1, dtype=np.int64)
+    dist = _fill_blocks(pair_rows, block_size, np.min_scalar_type(n*(n - 1)//2),
+                        lambda shared, start, stop: together[start:stop, None] + together[None, start:] - 2*shared)
+    return dist[np.ix_(inverse, inverse)]
+
+
+# distance matrix and distances to one assignment, by metric name
+METRICS = {'hamming': (hamming_matrix, hamming_distances),
+           'comembership': (comembership_matrix, comembership_distances)}
+
+
+def distance_matrix(pool, metric='hamming', block_size=BLOCK_SIZE):
+    """Returns the K x K distance matrix of pool under one of METRICS"""
+    if metric not in METRICS:
+        raise ValueError('unknown distance metric ' + repr(metric))
+    return METRICS[metric][0](pool, block_size)
+
+
+class DiverseSelector(object):
+    """Greedy selection of a diverse subset from a K x K distance matrix
+
+    objective is one of
+        'max_sum'   the candidate with the largest total distance to the picks
+        'max_min'   the candidate whose nearest pick is farthest away
+        'weighted'  the largest mean distance to the picks minus cost_weight
+                    times the candidate's cost above the cheapest candidate
+    costs (e.g. objective values, lower is better) are only used by
+    'weighted'. The first pick has the largest total distance to all
+    candidates. Ties go to the lowest index and no index is picked twice.
+    """
+
+    OBJECTIVES = ('max_sum', 'max_min', 'weighted')
+
+    def __init__(self, dist, objective='max_sum', costs=None, cost_weight=1.0):
+        if objective not in self.OBJECTIVES:
+            raise ValueError('unknown diversity objective ' + repr(objective))
+        if objective == 'weighted' and costs is None:
+            raise ValueError("the 'weighted' objective needs costs")
+        self.dist = dist
+        self.objective = objective
+        self.num_candidates = dist.shape[0]
+        self.costs = None if costs is None else np.asarray(costs, dtype=float)
+        self.cost_weight = cost_weight
+        self.chosen = []
+        self.available = np.ones(self.num_candidates, dtype=bool)
+        # total and smallest distance of every candidate to the picks so far
+        self.sums = np.zeros(self.num_candidates, dtype=np.int64)
+        self.mins = np.full(self.num_candidates, np.iinfo(np.int64).max, dtype=np.int64)
+
+    def _scores(self):
+        if not self.chosen:
+            return self.dist.sum(axis=0, dtype=np.int64).astype(float)
+        if self.objective == 'max_sum':
+            return self.sums.astype(float)
+        if self.objective == 'max_min':
+            return self.mins.astype(float)
+        extra_cost = self.costs - self.costs.min()
+        return self.sums/float(len(self.chosen)) - self.cost_weight*extra_cost
+
+    def add(self, index):
+        """Records index as picked and updates the distances to the picks"""
+        row = np.asarray(self.dist[index], dtype=np.int64)
+        self.sums += row
+        np.minimum(self.mins, row, out=self.mins)
+        self.available[index] = False
+        self.chosen.append(index)
+
+    def pick(self):
+        """Picks and returns the next index, or None when every candidate is picked"""
+        if not self.available.any():
+            return None
+        scores = np.where(self.available, self._scores(), -np.inf)
+        index = int(np.argmax(scores))
+        self.add(index)
+        return index
+
+    def select(self, limit):
+        """Picks until limit indices are chosen or none are left, returns the chosen indices"""
+        while len(self.chosen) < limit and self.pick() is not None:
+            pass
+        return list(self.chosen)
+
+
+class StreamingDiverseSet(object):
+    """Diverse subset of at most size solutions, maintained while solutions arrive
+
+    objective is 'max_sum' (total pairwise distance of the set) or
+    'max_min' (smallest pairwise distance, ties broken by the total),
+    with distances under metric, one of METRICS.
+    The first size solutions fill the set; after that a newcomer replaces
+    the member whose swap improves the objective most, if any does.
+    indices and assignments can be read at any time.
+    """
+
+    OBJECTIVES = ('max_sum', 'max_min')
+
+    def __init__(self, size, objective='max_sum', metric='hamming'):
+        if objective not in self.OBJECTIVES:
+            raise ValueError('unknown streaming diversity objective ' + repr(objective))
+        if metric not in METRICS:
+            raise ValueError('unknown distance metric ' + repr(metric))
+        self.size = size
+        self.objective = objective
+        self.distances = METRICS[metric][1]
+        self.indices = []
+        self.assignments = []
+        # pairwise distances of the members
+        self.dist = np.zeros((size, size), dtype=np.int64)
+        self.seen = 0
+        self.swaps = 0
+
+    def _value(self, dist):
+        total = dist.sum()//2
+        if self.objective == 'max_sum':
+            return (total,)
+        off_diagonal = dist[~np.eye(len(dist), dtype=bool)]
+        return (off_diagonal.min() if off_diagonal.size else 0, total)
+
+    def add(self, index, assignment):
+        """Offers solution index with the given assignment, returns True if it joins the set"""
+        self.seen += 1
+        assignment = np.asarray(assignment)
+        count = len(self.indices)
+        d = self.distances(self.assignments, assignment) if count else np.zeros(0, dtype=np.int64)
+        if count < self.size:
+            self.dist[count, :count] = d
+            self.dist[:count, count] = d
+            self.indices.append(index)
+            self.assignments.append(assignment)
+            return True
+
+        # objective of the set with member j replaced by the newcomer, for every j
+        best, best_value = None, self._value(self.dist)
+        for j in range(count):
+            trial = self.dist.copy()
+            trial[j, :] = d
+            trial[:, j] = d
+            trial[j, j] = 0
+            value = self._value(trial)
+            if value > best_value:
+                best, best_value = j, value
+        if best is None:
+            return False
+        self.dist[best, :] = d
+        self.dist[:, best] = d
+        self.dist[best, best] = 0
+        self.indices[best] = index
+        self.assignments[best] = assignment
+        self.swaps += 1
+        return True
+
+    def summary(self):
+        value = self._value(self.dist[:len(self.indices), :len(self.indices)])
+        return ('Streaming diversity: kept {kept} of {seen} solutions after {swaps} swaps, {name} {value}'
+                .format(kept=len(self.indices), seen=self.seen, swaps=self.swaps,
+                        name='total distance' if self.objective == 'max_sum' else 'smallest distance',
+                        value=value[0]))
@@ -0,0 +1,295 @@
+import numpy as np
+import scipy.sparse as sp
+
+from solver_backends import SolveResult
+
+"""
+Enumeration of the top assignments of a MatrixModel
+
+cut_loop solves the model, adds a no-good cut that excludes the solution
+found and solves again, yielding each solution in order. In incremental
+mode it keeps one live solver session (see solver_backends.py) and warm
+starts every re-solve from a feasible neighbour of the previous optimum.
+Cuts only remove solutions, so the proven bound of the previous solve
+is a lower bound for the next one; when the neighbour already attains
+it (ties are common with the preference costs) it is returned without
+a solve.
+
+pool_loop asks backends with a solution pool for the top solutions in a
+single branch-and-bound run and falls back to cut_loop otherwise.
+
+Both take an optional lazy_antiprefs.LazyAntiprefs for models built
+without anti-preference rows: a solution that places a bullet pair on
+one project gets its rows added and is not yielded.
+
+With min_distance d > 1 the cuts also remove every assignment within
+d-1 moved students of a solution found, so each solution differs from
+all earlier ones in at least d students: the best solution at distance
+d or more from the earlier ones, rather than the next best overall.
+
+diverse_loop is the optimizeTeams mode of team_assignment/optimize_teams.R:
+after the optimum it keeps the preference cost within a gap of the
+optimum and instead minimizes overlap with the solutions found so far.
+
+until_interrupted wraps any of them so that Ctrl-C during a solve ends
+the enumeration and keeps the solutions already yielded. All of them
+take an optional time_budget.TimeBudget that sets each solve's time
+limit and ends the enumeration when the whole budget is used up.
+"""
+
+# number of cheapest moves and swaps tried when looking for a MIP start
+START_CANDIDATES = 200
+# swap costs are computed for blocks of about this many student pairs at a time
+SWAP_BLOCK = 2**20
+
+
+def _cheapest(delta, count):
+    """Returns the flat indices of the (up to) count smallest finite entries of delta"""
+    flat = delta.ravel()
+    count = min(count, np.isfinite(flat).sum())
+    if count == 0:
+        return np.zeros(0, dtype=int)
+    return np.argpartition(flat, count - 1)[:count]
+
+
+def _cheapest_swaps(costs, current, assignment, count, block=SWAP_BLOCK):
+    """Returns (delta, i, l) of the count cheapest swaps of students i < l on different projects
+
+    The n x n swap costs are built a block of rows i at a time and only
+    the cheapest of each block are kept.
+    """
+    n = len(assignment)
+    students = np.arange(n)
+    rows_per_block = max(1, block//max(n, 1))
+    kept_delta, kept_i, kept_l = np.zeros(0), np.zeros(0, dtype=int), np.zeros(0, dtype=int)
+    for start in range(0, n - 1, rows_per_block):
+        stop = min(start + rows_per_block, n - 1)
+        # only partners after the block's first student can come after its rows
+        partners = students[start + 1:]
+        delta = (costs[start:stop][:, assignment[partners]] + costs[partners][:, assignment[start:stop]].T -
+                 current[start:stop, None] - current[None, partners])
+        delta[(assignment[start:stop, None] == assignment[None, partners]) |
+              (partners[None, :] <= students[start:stop, None])] = np.inf
+        best = _cheapest(delta, count)
+        i, l = np.unravel_index(best, delta.shape)
+        kept_delta = np.concatenate([kept_delta, delta.ravel()[best]])
+        kept_i = np.concatenate([kept_i, start + i])
+        kept_l = np.concatenate([kept_l, partners[l]])
+        keep = _cheapest(kept_delta, count)
+        kept_delta, kept_i, kept_l = kept_delta[keep], kept_i[keep], kept_l[keep]
+    return kept_delta, kept_i, kept_l
+
+
+def neighbour_start(model, assignment, max_candidates=START_CANDIDATES):
+    """Returns the cheapest feasible single move or pairwise swap away from
+    assignment as a column vector, or None if none of the candidates is feasible
+
+    The previous optimum is cut off by its no-good cut, so this is the
+    closest feasible point for the solver to start from.
+    """
+    # auxiliary columns would need their own values, so only plain models get a start
+    if model.num_vars != model.num_x:
+        return None
+
+    assignment = np.asarray(assignment)
+    n = model.num_students
+    students = np.arange(n)
+    # pairs without a column cost np.inf, so locked students never move
+    costs = model.x_matrix(model.obj, np.inf)
+    current = costs[students, assignment]
+    current[~np.isfinite(current)] = 0
+    x = model.columns(assignment)
+    A = model.A.tocsc()
+    activity = A.dot(x)
+
+    # moves: student i to project k
+    move_delta = costs - current[:, None]
+    move_delta[students, assignment] = np.inf
+    best = _cheapest(move_delta, max_candidates)
+    candidates = [(move_delta.flat[k], 'move', np.unravel_index(k, move_delta.shape)) for k in best]
+    # swaps: students i and l exchange projects
+    swap_delta, swap_i, swap_l = _cheapest_swaps(costs, current, assignment, max_candidates)
+    candidates.extend((delta, 'swap', (i, l)) for (delta, i, l) in zip(swap_delta, swap_i, swap_l))
+    candidates.sort(key=lambda candidate: candidate[0])
+
+    for (_, kind, (a, b)) in candidates:
+        if kind == 'move':
+            cols = [model.col_index[a, assignment[a]], model.col_index[a, b]]
+            vals = [-1.0, 1.0]
+        else:
+            cols = [model.col_index[a, assignment[a]], model.col_index[b, assignment[b]],
+                    model.col_index[a, assignment[b]], model.col_index[b, assignment[a]]]
+            vals = [-1.0, -1.0, 1.0, 1.0]
+        new_activity = activity + A[:, cols].dot(vals)
+        new_x = x.copy()
+        new_x[cols] += vals
+        if (np.all(new_x >= model.lb) and np.all(new_x <= model.ub) and
+                np.all(new_activity >= model.row_lo - 1e-6) and np.all(new_activity <= model.row_hi + 1e-6)):
+            return new_x
+    return None
+
+
+def _start_solve(budget, backend, solves_left, count):
+    """Sets the backend's time limit from budget, returns False when the budget is used up"""
+    if budget is None:
+        return True
+    if budget.expired():
+        print('Time budget used up after %d solutions' % count)
+        return False
+    budget.apply(backend, solves_left)
+    return True
+
+
+def cut_loop(model, backend, limit, incremental=True, first=None, lazy=None, min_distance=1, budget=None):
+    """Yields (assignment, result) for the top limit solutions of model, best first
+
+    Each solution is cut off from model before the next solve, so model
+    holds every no-good cut afterwards. With incremental=False every
+    solve starts from scratch. first is an optional SolveResult for the
+    first solve found by other means (e.g. min_cost_flow.solve_flow).
+    lazy separates anti-preference rows before a solution is accepted.
+    Solutions are at least min_distance students apart. budget is an
+    optional TimeBudget for all solves.
+    """
+    if incremental:
+        session = backend.open_session(model)
+        if lazy is not None and backend.supports_lazy:
+            session.lazy = lazy
+    count = 0
+    start = None
+    last_value = None
+    while count < limit:
+        if first is not None:
+            result, first = first, None
+        elif start is not None and last_value is not None and model.objective(start) <= last_value + 1e-9:
+            # the start attains the lower bound, so it is optimal
+            result = SolveResult('optimal', start, model.objective(start), last_value, 0, 0.0)
+        elif not _start_solve(budget, backend, limit - count, count):
+            return
+        elif incremental:
+            if start is not None:
+                session.set_start(start)
+            result = session.solve()
+        else:
+            result = backend.solve(model)
+        if budget is not None:
+            budget.record(result)
+        if not result.has_solution:
+            print('No further solutions found, solver status: ' + result.status)
+            return
+        if lazy is not None and lazy.separate(result.x) > 0:
+            # re-solve with the violated rows; the previous bound still holds
+            start = None
+            continue
+        assignment = model.assignment(result.x)
+        yield assignment, result
+        count += 1
+
+        model.add_no_good_cut(assignment, min_distance)
+        start = None
+        if incremental and count < limit:
+            # the proven bound of this solve also bounds the next one
+            last_value = result.bound
+            if last_value is None and result.status == 'optimal':
+                last_value = result.obj_value
+            # with integer costs the bound rounds up
+            if last_value is not None and model.integer_objective:
+                last_value = np.ceil(last_value - 1e-6)
+            # a single move or swap is too close to pass larger distance cuts
+            if min_distance <= 2:
+                start = neighbour_start(model, assignment)
+
+
+def pool_loop(model, backend, limit, incremental=True, first=None, lazy=None, min_distance=1, budget=None):
+    """Yields (assignment, result) like cut_loop, from the backend's solution pool if it has one
+
+    Pool solutions that only differ in auxiliary columns are reported
+    once, and any shortfall is made up by the cut loop. first is passed
+    on to cut_loop when the backend has no pool. With lazy, pool
+    solutions that violate an anti-preference are dropped; the ones left
+    are still the best, in order, since the pool covers a relaxation.
+    Pool solutions closer than min_distance to an earlier one are dropped.
+    The pool run gets all of budget that is left.
+    """
+    if not backend.supports_pool:
+        for solution in cut_loop(model, backend, limit, incremental, first, lazy, min_distance, budget):
+            yield solution
+        return
+
+    if not _start_solve(budget, backend, 1, 0):
+        return
+    count = 0
+    found = []
+    for result in backend.solve_pool(model, limit):
+        if not result.has_solution:
+            print('No solutions found, solver status: ' + result.status)
+            return
+        assignment = model.assignment(result.x)
+        if any(np.sum(assignment != other) < min_distance for other in found):
+            continue
+        if lazy is not None and lazy.separate(result.x) > 0:
+            continue
+        found.append(assignment)
+        model.add_no_good_cut(assignment, min_distance)
+        yield assignment, result
+        count += 1
+
+    if count < limit:
+        for solution in cut_loop(model, backend, limit - count, incremental, lazy=lazy, min_distance=min_distance,
+                                 budget=budget):
+            yield solution
+
+
+def diverse_loop(model, backend, limit, gap, incremental=True, first=None, budget=None):
+    """Yields (assignment, result) for the optimum and then up to limit-1 solutions
+    within a relative gap of it, each as far as possible from those before
+
+    After the optimum, the preference cost is bounded by (1+gap) times the
+    optimal value and the objective becomes the number of students placed
+    as in earlier solutions, summed over all of them. result.obj_value is
+    the preference cost. model keeps the gap row and cuts afterwards but
+    gets its objective back.
+    """
+    first_solution = next(cut_loop(model, backend, 1, incremental=False, first=first, budget=budget), None)
+    if first_solution is None:
+        return
+    assignment, result = first_solution
+    yield assignment, result
+
+    # stay within the gap of the optimum, as optimize_teams.R does with (1+gap_div)*opt_value
+    costs = model.obj.copy()
+    max_value = result.obj_value + gap*abs(result.obj_value)
+    model.add_rows(sp.csr_matrix(costs), -np.inf, max_value - model.obj_offset, 'gap')
+
+    # overlap with the earlier solutions, counted per solution
+    overlap = model.columns(assignment)
+    session = backend.open_session(model) if incremental else None
+    try:
+        for count in range(1, limit):
+            if not _start_solve(budget, backend, limit - count, count):
+                return
+            model.obj = overlap.copy()
+            result = session.solve() if incremental else backend.solve(model)
+            if budget is not None:
+                budget.record(result)
+            if not result.has_solution:
+                print('No further solutions within the gap, solver status: ' + result.status)
+                return
+            assignment = model.assignment(result.x)
+            x = model.columns(assignment)
+            model.add_no_good_cut(assignment)
+            overlap += x
+            value = float(np.dot(costs, result.x) + model.obj_offset)
+            yield assignment, SolveResult(result.status, result.x, value, None, result.node_count,
+                                          result.solve_time)
+    finally:
+        model.obj = costs
+
+
+def until_interrupted(solutions):
+    """Yields from solutions until they run out or a KeyboardInterrupt arrives during a solve"""
+    try:
+        for solution in solutions:
+            yield solution
+    except KeyboardInterrupt:
+        print('Interrupted, keeping the solutions found so far')
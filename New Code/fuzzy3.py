@@ -1,11 +1,22 @@
 import difflib
+import collections
+import numpy as np
 
 # by Mark McMahon
 # available from
 # http://aspn.activestate.com/ASPN/Cookbook/Python/Recipe/475148
 
 class FuzzyDict(dict):
-    "Provides a dictionary that performs fuzzy lookup"
+    """Provides a dictionary that performs fuzzy lookup
+
+    The results of the last CACHE_SIZE fuzzy lookups are kept (least
+    recently used dropped first) until a key is added or removed;
+    cache_hits and cache_misses count how often they were reused.
+    """
+
+    # number of fuzzy lookup results kept, 0 for none
+    CACHE_SIZE = 1024
+
     def __init__(self, items = None, cutoff = .6):
         """Construct a new FuzzyDict instance
 
@@ -14,6 +25,9 @@ class FuzzyDict(dict):
         cutoff needs to be a float between 0 and 1 (where zero is no match
         and 1 is a perfect match)"""
         super(FuzzyDict, self).__init__()
+        self._cache = collections.OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
 
         if items:
             self.update(items)
@@ -80,16 +94,67 @@ class FuzzyDict(dict):
             best_ratio)
 
 
+    def _keys_changed(self):
+        """Called before keys are added or removed"""
+        self._cache.clear()
+
+    def __setitem__(self, key, value):
+        if not self._dict_contains(key):
+            self._keys_changed()
+        super(FuzzyDict, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self._keys_changed()
+        super(FuzzyDict, self).__delitem__(key)
+
+    def update(self, *args, **kwargs):
+        self._keys_changed()
+        super(FuzzyDict, self).update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        self._keys_changed()
+        return super(FuzzyDict, self).setdefault(key, default)
+
+    def pop(self, *args):
+        self._keys_changed()
+        return super(FuzzyDict, self).pop(*args)
+
+    def popitem(self):
+        self._keys_changed()
+        return super(FuzzyDict, self).popitem()
+
+    def clear(self):
+        self._keys_changed()
+        super(FuzzyDict, self).clear()
+
+    def _cached_search(self, lookfor, stop_on_first = False):
+        """_search through the lookup cache; exact keys are not cached"""
+        if self.CACHE_SIZE <= 0 or self._dict_contains(lookfor):
+            return self._search(lookfor, stop_on_first)
+        # the value is read again, so changing the value of a key needs no invalidation
+        cache_key = (lookfor, stop_on_first, self.cutoff)
+        if cache_key in self._cache:
+            self._cache.move_to_end(cache_key)
+            self.cache_hits += 1
+            matched, key, ratio = self._cache[cache_key]
+            return matched, key, None if key is None else self._dict_getitem(key), ratio
+        self.cache_misses += 1
+        matched, key, item, ratio = self._search(lookfor, stop_on_first)
+        self._cache[cache_key] = (matched, key, ratio)
+        if len(self._cache) > self.CACHE_SIZE:
+            self._cache.popitem(last=False)
+        return matched, key, item, ratio
+
     def __contains__(self, item):
         "Overides Dictionary __contains__ to use fuzzy matching"
-        if self._search(item, True)[0]:
+        if self._cached_search(item, True)[0]:
             return True
         else:
             return False
 
     def __getitem__(self, lookfor):
         "Overides Dictionary __getitem__ to use fuzzy matching"
-        matched, key, item, ratio = self._search(lookfor)
+        matched, key, item, ratio = self._cached_search(lookfor)
 
         if not matched:
             raise KeyError(
@@ -99,6 +164,165 @@ class FuzzyDict(dict):
         return item
 
 
+class IndexedFuzzyDict(FuzzyDict):
+    """FuzzyDict that only scores keys that can still be the best match
+
+    Same interface and same matches as FuzzyDict, including the first key
+    in insertion order winning ties. An inverted index of character
+    trigrams shortlists the keys sharing most trigrams with the name
+    looked up, and those are scored first to get a good ratio early. The
+    quick_ratio of every key (its character multiset overlap, which bounds
+    ratio from above and itself lies below real_quick_ratio) comes from a
+    key x character count matrix in one vectorized step, and the full
+    SequenceMatcher ratio is then only computed for keys whose bound
+    reaches the best ratio found so far, best bound first.
+
+    The index covers string keys and is rebuilt on the first lookup after
+    keys are added or removed; dicts with other keys fall back to the
+    plain FuzzyDict scan.
+    """
+
+    # number of keys sharing the most trigrams that are scored first
+    SHORTLIST = 8
+
+    def __init__(self, items=None, cutoff=.6):
+        self._index = None
+        super(IndexedFuzzyDict, self).__init__(items, cutoff)
+
+    def _keys_changed(self):
+        super(IndexedFuzzyDict, self)._keys_changed()
+        self._index = None
+
+    @staticmethod
+    def _trigrams(text):
+        return [text[k:k+3] for k in range(len(text) - 2)]
+
+    def _build_index(self):
+        """Key list, key lengths, key x character counts and trigram postings"""
+        keys = list(dict.keys(self))
+        if not all(isinstance(key, str) for key in keys):
+            return None
+        alphabet = dict((char, k) for (k, char) in enumerate(sorted(set(''.join(keys)))))
+        counts = np.zeros((len(keys), len(alphabet)), dtype=np.int32)
+        postings = {}
+        for (position, key) in enumerate(keys):
+            for (char, count) in collections.Counter(key).items():
+                counts[position, alphabet[char]] = count
+            for trigram in set(self._trigrams(key)):
+                postings.setdefault(trigram, []).append(position)
+        postings = dict((trigram, np.array(found)) for (trigram, found) in postings.items())
+        lengths = np.array([len(key) for key in keys], dtype=np.int64)
+        return keys, lengths, alphabet, counts, postings
+
+    def _bounds(self, lookfor):
+        """quick_ratio of every key, 2*(shared characters)/(total length) as difflib computes it"""
+        keys, lengths, alphabet, counts, _ = self._index
+        wanted = collections.Counter(char for char in lookfor if char in alphabet)
+        shared = np.zeros(len(keys), dtype=np.int64)
+        for (char, count) in wanted.items():
+            shared += np.minimum(counts[:, alphabet[char]], count)
+        total = lengths + len(lookfor)
+        return np.where(total > 0, 2.0*shared/np.maximum(total, 1), 1.0)
+
+    def _ratio_function(self, lookfor):
+        keys = self._index[0]
+        # same argument order as FuzzyDict, ratio is not symmetric
+        ratio_calc = difflib.SequenceMatcher()
+        ratio_calc.set_seq1(lookfor)
+        return lambda position: (ratio_calc.set_seq2(keys[position]), ratio_calc.ratio())[1]
+
+    def _ranked(self, lookfor, count):
+        """Returns the count best (ratio, position) pairs with a positive ratio, best first
+
+        Ties go to the earlier position, so the first pair is the match of
+        the plain scan.
+        """
+        keys, _, _, _, postings = self._index
+        bounds = self._bounds(lookfor)
+        ratio_of = self._ratio_function(lookfor)
+
+        # keys sharing the most trigrams first, then the rest by bound
+        found = [postings[trigram] for trigram in set(self._trigrams(lookfor)) if trigram in postings]
+        shortlist = np.zeros(0, dtype=np.int64)
+        if found:
+            votes = np.bincount(np.concatenate(found), minlength=len(keys))
+            shortlist = np.argsort(-votes, kind='stable')[:self.SHORTLIST]
+            shortlist = shortlist[votes[shortlist] > 0]
+        order = np.concatenate([shortlist, np.lexsort((np.arange(len(keys)), -bounds))])
+        shortlist = set(shortlist.tolist())
+
+        # (-ratio, position) of the best keys so far, in order
+        top = []
+        scored = set()
+        for position in order.tolist():
+            if position in scored:
+                continue
+            bound = bounds[position]
+            # a key can only get in with a higher ratio, or the same one and an earlier position
+            if bound == 0 or (len(top) == count and (-bound, position) > top[-1]):
+                if position not in shortlist:
+                    break
+                continue
+            scored.add(position)
+            ratio = ratio_of(position)
+            if ratio > 0 and (len(top) < count or (-ratio, position) < top[-1]):
+                top = sorted(top + [(-ratio, position)])[:count]
+        return [(-ratio, position) for (ratio, position) in top]
+
+    def _indexed(self, lookfor):
+        """Whether lookfor can be searched through the index, building it if needed"""
+        if not isinstance(lookfor, str):
+            return False
+        if self._index is None:
+            self._index = self._build_index()
+        return self._index is not None
+
+    def matches(self, lookfor, count=2):
+        """Returns the count best (key, value, ratio) matches of lookfor, best first
+
+        The first is the one lookups return; keys with ratio 0 are left out.
+        """
+        if not self._indexed(lookfor):
+            matched, key, item, ratio = self._search(lookfor)
+            return [(key, item, ratio)] if key is not None else []
+        keys = self._index[0]
+        return [(keys[position], self._dict_getitem(keys[position]), ratio)
+                for (ratio, position) in self._ranked(lookfor, count)]
+
+    def candidates(self, lookfor, cutoff=None):
+        """Returns the (key, value) pairs that can match lookfor with at least cutoff, in order
+
+        Every key scoring cutoff (default self.cutoff) or more is among them,
+        so the best match only changes when they do.
+        """
+        cutoff = self.cutoff if cutoff is None else cutoff
+        if not self._indexed(lookfor):
+            return list(self.items())
+        keys = self._index[0]
+        return [(keys[position], self._dict_getitem(keys[position]))
+                for position in np.flatnonzero(self._bounds(lookfor) >= cutoff).tolist()]
+
+    def _search(self, lookfor, stop_on_first = False):
+        if self._dict_contains(lookfor):
+            return True, lookfor, self._dict_getitem(lookfor), 1
+        if not self._indexed(lookfor):
+            return super(IndexedFuzzyDict, self)._search(lookfor, stop_on_first)
+        keys = self._index[0]
+
+        if stop_on_first:
+            # the first key in order that reaches the cutoff, as the plain scan finds it
+            ratio_of = self._ratio_function(lookfor)
+            for position in np.flatnonzero(self._bounds(lookfor) >= self.cutoff):
+                ratio = ratio_of(position)
+                if ratio >= self.cutoff:
+                    return True, keys[position], self._dict_getitem(keys[position]), ratio
+
+        ranked = self._ranked(lookfor, 1)
+        if not ranked:
+            return False, None, None, 0
+        best_ratio, best_position = ranked[0]
+        best_key = keys[best_position]
+        return best_ratio >= self.cutoff, best_key, self._dict_getitem(best_key), best_ratio
 
 if __name__ == '__main__':
     import unittest
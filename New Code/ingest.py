@@ -0,0 +1,78 @@
+import numpy as np
+import pandas as pd
+
+"""
+Ingestion of the survey and student files
+
+read_cohort reads both CSVs once, lines the survey rows up with the
+student rows in a single reindex on the token, and turns the
+'project [k]' preference codes into the integer penalty matrix with one
+table lookup, so no cell is visited from Python. Every array has one row
+per student, in the order of the student file, which is the row order
+of the IP.
+"""
+
+
+class Cohort(object):
+    """Survey and student data of one cohort as typed arrays, in student file order
+
+    tokens      student tokens (object array)
+    names       'First Last' names, stripped (object array)
+    penalties   num_students x num_projects int64 penalty matrix
+    gpas        cumulative GPAs (float64)
+    bullets     num_students x 2 object array of anti-preference names, None where blank
+    survey, students are the DataFrames as read, for the report writer.
+    """
+
+    def __init__(self, tokens, names, penalties, gpas, bullets, survey, students):
+        self.tokens = tokens
+        self.names = names
+        self.penalties = penalties
+        self.gpas = gpas
+        self.bullets = bullets
+        self.survey = survey
+        self.students = students
+
+    @property
+    def token_index(self):
+        """Row of every token"""
+        return dict(zip(self.tokens.tolist(), range(len(self.tokens))))
+
+
+def penalty_table(penalty_dict):
+    """Returns an int64 array with the penalty of preference code c at index c"""
+    table = np.zeros(max(penalty_dict.keys()) + 1, dtype=np.int64)
+    for (code, cost) in penalty_dict.items():
+        table[code] = int(cost)
+    return table
+
+
+def read_cohort(survey_file, student_file, project_cols, penalty_dict,
+                bullet_cols=('bullets [1]', 'bullets [2]')):
+    """Reads and aligns the survey and student files, returns a Cohort
+
+    penalty_dict maps preference codes to costs (strings or numbers).
+    Raises ValueError if a student has no survey row or a preference code
+    has no penalty.
+    """
+    survey = pd.read_csv(survey_file, index_col='Token', sep=',')
+    students = pd.read_csv(student_file, index_col='ID Number', sep=',')
+    text = students.select_dtypes(include='object').columns
+    students[text] = students[text].apply(lambda column: column.str.strip())
+
+    # survey rows in student order
+    aligned = survey.reindex(students.index)
+    missing = aligned[project_cols].isnull().any(axis=1).to_numpy()
+    if missing.any():
+        raise ValueError('no survey preferences for students ' + ', '.join(map(str, students.index[missing])))
+
+    codes = aligned[project_cols].to_numpy(dtype=np.int64)
+    known = np.isin(codes, list(penalty_dict.keys()))
+    if not known.all():
+        raise ValueError('preference codes without a penalty: ' + ', '.join(map(str, np.unique(codes[~known]))))
+
+    bullets = aligned[list(bullet_cols)].astype(object)
+    bullets = bullets.where(bullets.notnull(), None).to_numpy()
+    names = (students['First Name'] + ' ' + students['Last Name']).to_numpy(dtype=object)
+    return Cohort(students.index.to_numpy(dtype=object), names, penalty_table(penalty_dict)[codes],
+                  students['Cumulative GPA'].to_numpy(dtype=np.float64), bullets, survey, students)
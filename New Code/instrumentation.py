@@ -0,0 +1,168 @@
+import os
+import sys
+import glob
+import json
+import time
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, peak RSS is then left out
+    resource = None
+
+"""
+Run metrics for optimizeIP_picos.py
+
+A Metrics object times the phases of a run (reading the CSVs, resolving
+anti-preferences, building the model, the enumeration, diversity
+selection), each with wall and CPU time, records every solve with its
+status, objective, bound, node count and times, the size of the model
+(columns, rows, nonzeros) and the peak resident set size, and writes it
+all to METRICS_DIR/metrics_<run>.json next to Results/.
+
+Phases follow each other: begin(name) ends the phase before it, so the
+script needs no extra indentation.
+
+To compare runs:
+python instrumentation.py                     # the last two runs in METRICS_DIR
+python instrumentation.py run1.json run2.json ...
+"""
+
+METRICS_DIR = 'Metrics'
+
+
+def peak_rss_mb():
+    """Returns the peak resident set size of this process in MB, None where unknown"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak/(1024.0*1024.0) if sys.platform == 'darwin' else peak/1024.0
+
+
+def _number(value):
+    """Returns numpy and Python numbers as a JSON-friendly float, None stays None"""
+    return None if value is None else float(value)
+
+
+class Metrics(object):
+    """Phase timings, solves and model size of one run"""
+
+    def __init__(self, run=None):
+        self.run = run if run is not None else time.time()
+        self.phases = []
+        self.solves = []
+        self.model = {}
+        self.info = {}
+        self.current = None
+
+    def begin(self, name):
+        """Ends the current phase, if any, and starts phase name"""
+        self.end()
+        self.current = (name, time.time(), time.process_time())
+
+    def end(self):
+        """Ends the current phase"""
+        if self.current is None:
+            return
+        name, wall, cpu = self.current
+        self.phases.append({'phase': name, 'wall': time.time() - wall, 'cpu': time.process_time() - cpu})
+        self.current = None
+
+    def record_model(self, model, name='model'):
+        """Records the size of a MatrixModel under name"""
+        self.model[name] = {'columns': int(model.num_vars), 'rows': int(model.num_rows), 'nonzeros': int(model.A.nnz)}
+
+    def timed_solutions(self, solutions):
+        """Yields from an enumeration of (assignment, result), recording every solution it took
+
+        The wall and CPU time are those spent in the enumeration for that
+        solution, cuts and rebuilds included; solve_time is the solver's own
+        and report_wall the time the caller took with it (writing reports).
+        """
+        solutions = iter(solutions)
+        while True:
+            wall, cpu = time.time(), time.process_time()
+            try:
+                assignment, result = next(solutions)
+            except StopIteration:
+                return
+            record = {'status': result.status, 'objective': _number(result.obj_value),
+                      'bound': _number(result.bound), 'nodes': None if result.node_count is None else int(result.node_count),
+                      'solve_time': _number(result.solve_time),
+                      'wall': time.time() - wall, 'cpu': time.process_time() - cpu, 'report_wall': None}
+            self.solves.append(record)
+            report = time.time()
+            yield assignment, result
+            record['report_wall'] = time.time() - report
+
+    def as_dict(self):
+        self.end()
+        return {'run': self.run, 'phases': self.phases, 'solves': self.solves, 'model': self.model,
+                'peak_rss_mb': peak_rss_mb(), 'info': self.info}
+
+    def write(self, metrics_dir=METRICS_DIR):
+        """Writes the metrics to metrics_dir/metrics_<run>.json, returns the path"""
+        if not os.path.isdir(metrics_dir):
+            os.makedirs(metrics_dir)
+        path = os.path.join(metrics_dir, 'metrics_{run}.json'.format(run=self.run))
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=1)
+        return path
+
+    def summary(self):
+        return format_summary([self.as_dict()])
+
+
+def _totals(metrics):
+    """Returns an ordered list of (label, value) rows for one metrics dict"""
+    rows = []
+    for phase in metrics['phases']:
+        rows.append(('%s wall (s)' % phase['phase'], phase['wall']))
+        rows.append(('%s cpu (s)' % phase['phase'], phase['cpu']))
+    solves = metrics['solves']
+    rows.append(('solutions', len(solves)))
+    rows.append(('enumeration wall (s)', sum(s['wall'] for s in solves)))
+    rows.append(('solver time (s)', sum(s['solve_time'] or 0 for s in solves)))
+    rows.append(('report writing (s)', sum(s['report_wall'] or 0 for s in solves)))
+    rows.append(('nodes', sum(s['nodes'] or 0 for s in solves)))
+    for (name, size) in metrics['model'].items():
+        for key in ('columns', 'rows', 'nonzeros'):
+            rows.append(('%s %s' % (name, key), size[key]))
+    rows.append(('peak RSS (MB)', metrics['peak_rss_mb']))
+    return rows
+
+
+def format_summary(runs):
+    """Returns a table of the metrics dicts in runs side by side, with the change from the first"""
+    tables = [_totals(metrics) for metrics in runs]
+    labels = []
+    for table in tables:
+        labels.extend(label for (label, _) in table if label not in labels)
+    values = [dict(table) for table in tables]
+    width = max(len(label) for label in labels)
+    lines = [' '.join([' '*width] + ['%14s' % ('run %d' % (k + 1)) for k in range(len(runs))] +
+                      (['%10s' % 'change'] if len(runs) > 1 else []))]
+    for label in labels:
+        cells = ['%14s' % ('-' if value.get(label) is None else '%.3f' % value[label]
+                           if isinstance(value[label], float) else value[label]) for value in values]
+        if len(runs) > 1:
+            first, last = values[0].get(label), values[-1].get(label)
+            change = '-' if not first or last is None else '%+.1f%%' % (100.0*(last - first)/first)
+            cells.append('%10s' % change)
+        lines.append(' '.join([label.ljust(width)] + cells))
+    return '\n'.join(lines)
+
+
+if __name__ == '__main__':
+    paths = sys.argv[1:] or sorted(glob.glob(os.path.join(METRICS_DIR, 'metrics_*.json')),
+                                   key=os.path.getmtime)[-2:]
+    if not paths:
+        print('No metrics files in ' + METRICS_DIR)
+        sys.exit(1)
+    runs = []
+    for path in paths:
+        with open(path) as f:
+            runs.append(json.load(f))
+    print('\n'.join('run %d: %s' % (k + 1, path) for (k, path) in enumerate(paths)))
+    print(format_summary(runs))
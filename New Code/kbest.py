@@ -0,0 +1,160 @@
+import os
+import heapq
+import itertools
+import multiprocessing
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+
+from min_cost_flow import flow_instance, solve_flow
+from enumerate_solutions import cut_loop
+
+"""
+Partitioned k-best enumeration (Murty/Lawler)
+
+Every node of the search is the model with some x[i,j] fixed to 1 and
+some fixed to 0. Once the best assignment a of a node is known, the rest
+of the node is split into disjoint children over its unfixed students
+s_1, s_2, ...: child k fixes x[s_1,a_1] ... x[s_(k-1),a_(k-1)] to 1 and
+x[s_k,a_k] to 0. Every other assignment of the node lies in exactly one
+child, so taking solved nodes from a priority queue by objective value
+gives the top solutions in order, the same ranked list as the cut loop
+in enumerate_solutions.py (up to the order of ties).
+
+Children enter the queue unsolved, keyed by their parent's value, which
+bounds theirs from below, and are only solved once they reach the front.
+Up to `workers` unsolved nodes at the front are solved at a time on a
+process pool; each subproblem goes to min-cost flow when it qualifies
+and to the MIP backend otherwise.
+
+Every solution costs about one solve per free student, against one
+warm-started solve in the cut loop, so the search only pays off with
+a pool of many cores; benchmarks.py kbest compares the two. Where no
+such pool can run, kbest runs the cut loop instead.
+"""
+
+# model and live solver session of each pool worker, set once by _init_worker
+_worker_model = None
+_worker_session = None
+_worker_flow = False
+
+
+def forks_workers():
+    """Whether pool workers start as forks of this process
+
+    The pools are started from optimizeIP_picos.py, a script without a
+    main guard: a spawned worker (the default on macOS and Windows) would
+    import it again and rerun the whole pipeline, so callers solve in
+    this process instead.
+    """
+    return multiprocessing.get_start_method() == 'fork'
+
+
+def _init_worker(model, backend):
+    global _worker_model, _worker_session, _worker_flow
+    _worker_model = model
+    # every node only changes bounds, which live sessions push without a rebuild
+    _worker_session = backend.open_session(model)
+    # nodes only try min-cost flow when the whole model qualifies
+    _worker_flow = flow_instance(model) is not None
+
+
+def _solve_node(node):
+    """Solves the worker's model with the node's columns fixed to 1 and 0"""
+    (ones, zeros) = node
+    model = _worker_model
+    lb, ub = model.lb, model.ub
+    model.lb = lb.copy()
+    model.ub = ub.copy()
+    model.lb[ones] = 1
+    model.ub[zeros] = 0
+    try:
+        return (_worker_flow and solve_flow(model)) or _worker_session.solve()
+    finally:
+        model.lb, model.ub = lb, ub
+
+
+def _children(model, node, assignment):
+    """Splits a solved node into disjoint children around its best assignment"""
+    (ones, zeros) = node
+    fixed = set(model.var_student[ones].tolist())
+    students = [i for i in model.free_students if i not in fixed]
+    cols = model.col_index[students, np.asarray(assignment)[students]]
+    children = []
+    for k in range(len(students)):
+        children.append((np.concatenate([ones, cols[:k]]).astype(int),
+                         np.append(zeros, cols[k]).astype(int)))
+    return children
+
+
+def kbest(model, backend, limit, workers=None, first=None, budget=None, fallback=True):
+    """Yields (assignment, result) for the top limit solutions of model, best first
+
+    workers is the size of the process pool, None or 1 to solve in this
+    process, as is also done where workers are not forked (see
+    forks_workers). With fallback, the solutions come from the
+    incremental cut_loop instead (which adds its cuts to model) unless
+    there are 2 to os.cpu_count() forked workers. first is an optional
+    SolveResult for the whole model found by other means (e.g.
+    min_cost_flow.solve_flow). The search does not change model.
+    The search stops when the optional TimeBudget budget is used up; it
+    only sets per-node time limits when solving in this process, pool
+    workers keep the backend's own.
+    """
+    pool = None
+    if workers is not None and workers > 1 and not forks_workers():
+        print('Pool workers are not forked on this platform')
+        workers = None
+    cpus = os.cpu_count() or 1
+    if fallback and (workers is None or workers <= 1 or workers > cpus):
+        print('Enumerating with the cut loop: the k-best search needs more than one forked worker and at most '
+              'one per CPU (%d here)' % cpus)
+        yield from cut_loop(model, backend, limit, first=first, budget=budget)
+        return
+    if workers is not None and workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(model, backend))
+        solve_all = lambda nodes: list(pool.map(_solve_node, nodes))
+    else:
+        _init_worker(model, backend)
+        solve_all = lambda nodes: [_solve_node(node) for node in nodes]
+
+    # entries are (value, unsolved, tie-breaker, node, result); on equal
+    # values solved nodes come first, since an unsolved one can only be worse
+    counter = itertools.count()
+    root = (np.zeros(0, dtype=int), np.zeros(0, dtype=int))
+    if first is not None:
+        queue = [(first.obj_value, 0, next(counter), root, first)]
+    else:
+        queue = [(-np.inf, 1, next(counter), root, None)]
+    count = 0
+    try:
+        while count < limit and queue:
+            if not queue[0][1]:
+                value, _, _, node, result = heapq.heappop(queue)
+                assignment = model.assignment(result.x)
+                yield assignment, result
+                count += 1
+                for child in _children(model, node, assignment):
+                    heapq.heappush(queue, (value, 1, next(counter), child, None))
+                continue
+
+            # solve the unsolved nodes at the front of the queue together
+            if budget is not None:
+                if budget.expired():
+                    print('Time budget used up after %d solutions' % count)
+                    return
+                if pool is None:
+                    budget.apply(backend, limit - count)
+            batch = []
+            while queue and queue[0][1] and len(batch) < (workers or 1):
+                batch.append(heapq.heappop(queue))
+            for (entry, result) in zip(batch, solve_all([entry[3] for entry in batch])):
+                if result.has_solution:
+                    heapq.heappush(queue, (result.obj_value, 0, entry[2], entry[3], result))
+                elif result.status != 'infeasible':
+                    # e.g. a time limit: the part of the search space in this node is lost
+                    print('k-best subproblem not solved, solver status: ' + result.status)
+        if count < limit:
+            print('No further solutions found')
+    finally:
+        if pool is not None:
+            pool.shutdown()
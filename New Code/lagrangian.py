@@ -0,0 +1,238 @@
+import time
+import numpy as np
+import scipy.sparse as sp
+
+from solver_backends import SolveResult
+from min_cost_flow import TransportationSession, flow_costs, staffing_bounds
+
+"""
+Lagrangian relaxation of the anti-preference and GPA rows
+
+The staffing and assignment rows of a MatrixModel form a transportation
+problem (see min_cost_flow.py). Every other row (anti-preferences, GPA,
+cuts) is moved into the objective with a multiplier lam_r >= 0:
+
+    L(lam) = min  c*x + lam*(A_side*x - b_side)  over transportation x
+
+Each L(lam) is a lower bound on the optimum and is solved by min-cost
+flow, warm started from the project prices of the step before. The multipliers follow projected subgradient steps towards the best
+known feasible value, restarting from the best multipliers with half the
+step when the bound stalls, and every subproblem solution is repaired
+into a feasible assignment by a local search over single moves and swaps.
+"""
+
+# number of subgradient iterations
+MAX_ITERATIONS = 200
+# halve the step scale after this many iterations without a better bound
+PATIENCE = 10
+
+
+def _split_rows(model):
+    """Returns the side rows as A_side*x <= b_side, with >= rows negated"""
+    side = np.setdiff1d(np.arange(model.num_rows),
+                        np.concatenate([model.block('staffing'), model.block('assignment')]), assume_unique=True)
+    A = model.A.tocsr()[side]
+    upper = np.isfinite(model.row_hi[side])
+    lower = np.isfinite(model.row_lo[side])
+    A_side = A[np.flatnonzero(upper)]
+    b_side = model.row_hi[side][upper]
+    if lower.any():
+        A_side = sp.vstack([A_side, -A[np.flatnonzero(lower)]], format='csr')
+        b_side = np.concatenate([b_side, -model.row_lo[side][lower]])
+    return A_side, b_side
+
+
+def _candidates(model, assignment, students):
+    """Single moves and pairwise swaps of the given students
+
+    Returns (student, project, partner) arrays, partner -1 for a move, and
+    the columns switched on (plus) and off (minus) by each, as two
+    columns per candidate (moves repeat their column).
+    """
+    n, p = model.num_students, model.num_projects
+    # moves of student i to every project
+    move_stu = np.repeat(students, p)
+    move_proj = np.tile(np.arange(p), len(students))
+    keep = move_proj != assignment[move_stu]
+    move_stu, move_proj = move_stu[keep], move_proj[keep]
+    # swaps of student i with every student l on another project
+    swap_stu = np.repeat(students, n)
+    swap_other = np.tile(np.arange(n), len(students))
+    keep = assignment[swap_other] != assignment[swap_stu]
+    swap_stu, swap_other = swap_stu[keep], swap_other[keep]
+
+    stu = np.concatenate([move_stu, swap_stu])
+    proj = np.concatenate([move_proj, assignment[swap_other]])
+    partner = np.concatenate([-np.ones(len(move_stu), dtype=int), swap_other])
+    ci = model.col_index
+    plus = np.column_stack([ci[stu, proj], np.where(partner >= 0, ci[partner, assignment[stu]], ci[stu, proj])])
+    minus = np.column_stack([ci[stu, assignment[stu]],
+                             np.where(partner >= 0, ci[partner, assignment[partner]], ci[stu, assignment[stu]])])
+    return stu, proj, partner, plus, minus
+
+
+def repair(model, assignment, costs=None, max_steps=None):
+    """Returns a feasible assignment near the given one, or None if repair fails
+
+    Local search on the total violation of the side rows: students in
+    the most violated row are moved or swapped, one step at a time, taking the
+    step that removes most violation and, among those, costs least.
+    Staffing bounds, locks and bars are kept throughout.
+    """
+    if costs is None:
+        costs = flow_costs(model)
+    lower, upper = staffing_bounds(model)
+    A_side, b_side = _split_rows(model)
+    A_side_rows = A_side.tocsr()
+    A_side = A_side.tocsc()
+    assignment = np.array(assignment)
+    n = model.num_students
+    load = np.bincount(assignment, minlength=model.num_projects)
+    x = model.columns(assignment)
+    activity = A_side.dot(x)
+    if max_steps is None:
+        max_steps = 2*n
+
+    for _ in range(max_steps):
+        excess = np.maximum(activity - b_side, 0)
+        worst = np.argmax(excess)
+        if excess[worst] <= 1e-9:
+            return assignment
+        # students on a project that pushes the most violated row up
+        row = A_side_rows[worst]
+        pushing = row.indices[(x[row.indices] > 0.5) & (row.data > 0)]
+        students = np.unique(model.var_student[pushing])
+
+        stu, proj, partner, plus, minus = _candidates(model, assignment, students)
+        is_move = partner < 0
+        # barred pairs cost inf, and inf - inf is nan, which isfinite drops below
+        with np.errstate(invalid='ignore'):
+            delta_cost = np.where(is_move, costs[stu, proj] - costs[stu, assignment[stu]],
+                                  costs[stu, proj] + costs[partner.clip(0), assignment[stu]] -
+                                  costs[stu, assignment[stu]] - costs[partner.clip(0), proj])
+        # moves must keep both projects within their staffing bounds
+        allowed = np.isfinite(delta_cost) & (~is_move | ((load[assignment[stu]] > lower[assignment[stu]]) &
+                                                         (load[proj] < upper[proj])))
+        if not allowed.any():
+            return None
+        stu, proj, partner = stu[allowed], proj[allowed], partner[allowed]
+        plus, minus, delta_cost = plus[allowed], minus[allowed], delta_cost[allowed]
+        is_move = partner < 0
+
+        # change of every row activity under each candidate (moves count their columns once)
+        count = len(stu)
+        weight = np.column_stack([np.ones(count), np.where(is_move, 0.0, 1.0)]).ravel()
+        pick = sp.csc_matrix((weight, (np.arange(2*count), np.repeat(np.arange(count), 2))),
+                             shape=(2*count, count))
+        change = (A_side[:, plus.ravel()].dot(pick) - A_side[:, minus.ravel()].dot(pick)).tocsc()
+        rows, owner = change.indices, np.repeat(np.arange(count), np.diff(change.indptr))
+        gain = np.maximum(activity[rows] + change.data - b_side[rows], 0) - excess[rows]
+        delta_excess = np.bincount(owner, weights=gain, minlength=count)
+
+        best = np.lexsort((delta_cost, delta_excess))[0]
+        if delta_excess[best] > -1e-9:
+            # stuck in a local minimum of the violation
+            return None
+        i, k, l = stu[best], proj[best], partner[best]
+        j = assignment[i]
+        activity = activity + change[:, best].toarray().ravel()
+        cols = np.concatenate([plus[best], minus[best]])
+        if l < 0:
+            x[cols[[0, 2]]] = [1, 0]
+            assignment[i] = k
+            load[j] -= 1
+            load[k] += 1
+        else:
+            x[cols] = [1, 1, 0, 0]
+            assignment[i], assignment[l] = k, j
+    return None
+
+
+def solve_lagrangian(model, max_iterations=MAX_ITERATIONS, time_limit=None, verbose=False):
+    """Solves a MatrixModel by Lagrangian relaxation, returns a SolveResult
+
+    The result carries the best repaired assignment, its objective value
+    and the best Lagrangian lower bound; result.gap is the relative gap
+    between them. time_limit (seconds) stops the subgradient loop early.
+    Returns None for models with auxiliary columns.
+    """
+    if model.num_vars != model.num_x:
+        return None
+    start = time.time()
+    costs = flow_costs(model)
+    # the prices change a little from step to step, so each subproblem
+    # starts from the project prices of the one before
+    flow = TransportationSession(*staffing_bounds(model))
+    A_side, b_side = _split_rows(model)
+    integer_costs = model.integer_objective
+
+    lam = np.zeros(len(b_side))
+    best_lam = lam
+    best_bound = -np.inf
+    best_value = np.inf
+    best_assignment = None
+    scale = 2.0
+    stalled = 0
+
+    for iteration in range(max_iterations):
+        # subproblem: transportation with row prices folded into the costs
+        priced = costs + model.x_matrix(A_side.T.dot(lam))
+        assignment = flow.solve(priced)
+        if assignment is None:
+            # the staffing rows alone are infeasible
+            return SolveResult('infeasible', solve_time=time.time() - start)
+        x = model.columns(assignment)
+        subgradient = A_side.dot(x) - b_side
+        bound = model.objective(x) + float(np.dot(lam, subgradient))
+
+        if bound > best_bound + 1e-9:
+            best_bound = bound
+            best_lam, best_subgradient = lam, subgradient
+            stalled = 0
+        else:
+            stalled += 1
+
+        # repair into a feasible assignment for the upper bound
+        repaired = repair(model, assignment, costs)
+        if repaired is not None:
+            value = model.objective(model.columns(repaired))
+            if value < best_value:
+                best_value = value
+                best_assignment = repaired
+
+        if verbose:
+            print('iteration %d: bound %.2f, best value %.2f' % (iteration, best_bound, best_value))
+
+        # stop at a zero gap (after rounding the bound up for integer costs)
+        rounded_bound = np.ceil(best_bound - 1e-6) if integer_costs else best_bound
+        if best_value <= rounded_bound + 1e-9 or scale < 1e-4:
+            break
+        if time_limit is not None and time.time() - start > time_limit:
+            break
+
+        # after PATIENCE steps without a better bound, step again from the best
+        # multipliers with half the scale
+        if stalled >= PATIENCE:
+            scale /= 2
+            stalled = 0
+            lam, subgradient, bound = best_lam, best_subgradient, best_bound
+
+        # Polyak step towards the best known value, projected onto lam >= 0: rows at
+        # lam = 0 with slack cannot move and are left out of the direction
+        direction = np.where((lam <= 0) & (subgradient < 0), 0, subgradient)
+        norm = np.dot(direction, direction)
+        if norm == 0:
+            # the subproblem solution is feasible and complementary, so optimal
+            break
+        target = best_value if np.isfinite(best_value) else bound + abs(bound)*0.1 + 1
+        # a target at or below the bound would step backwards
+        target = max(target, bound + 1e-3*max(1.0, abs(bound)))
+        lam = np.maximum(0, lam + scale*(target - bound)/norm*direction)
+
+    if integer_costs:
+        best_bound = float(np.ceil(best_bound - 1e-6))
+    if best_assignment is None:
+        return SolveResult('no_solution', bound=best_bound, solve_time=time.time() - start)
+    status = 'optimal' if best_value <= best_bound + 1e-9 else 'feasible'
+    return SolveResult(status, model.columns(best_assignment), best_value, best_bound, None,
+                       time.time() - start)
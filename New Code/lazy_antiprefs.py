@@ -0,0 +1,83 @@
+import numpy as np
+
+"""
+Lazy generation of the anti-preference rows
+
+A model built with build_matrix_model(..., lazy_antiprefs=True) has no
+anti-preference rows, only the list of bullet pairs. Almost none of the
+2*|antiprefs|*num_projects rows bind at the optimum, so the model is
+solved without them, the solution is checked for pairs placed on the
+same project, only the rows for those (pair, project) combinations are
+added, and the model is solved again until no pair is violated.
+
+The enumeration loops in enumerate_solutions.py take a LazyAntiprefs and
+do this before accepting a solution. Backends with lazy constraint
+callbacks (gurobi) also receive it and add the rows inside the
+branch-and-bound run instead, which is the only way this pays off: with
+re-solves from scratch (e.g. HiGHS) the rounds are 10-25x slower than
+building every row (benchmarks.py lazy), so optimizeIP_picos.py only
+uses it with backends that have supports_lazy.
+"""
+
+
+class LazyAntiprefs(object):
+    """Separates violated anti-preference rows of a lazily built MatrixModel"""
+
+    def __init__(self, model):
+        self.model = model
+        # (pair index, project) combinations whose row is in the model
+        self.added = set()
+        self.rows_added = 0
+        self.rounds = 0
+
+    def _violations(self, x, tol=1e-6):
+        """Returns the rows x violates as (A, lo, hi, keys) with (pair index, project) keys"""
+        model = self.model
+        pairs = model.antipref_pairs
+        assignment = model.assignment(x)
+        # a row can only be violated when both students share a project
+        candidates = np.flatnonzero(assignment[pairs[:, 0]] == assignment[pairs[:, 1]])
+        projects = assignment[pairs[candidates, 0]]
+        A, lo, hi = model.antipref_rows(candidates, projects)
+        # with allow_antiprefs_gpa the row may be paid for by y1
+        violated = np.flatnonzero(A.dot(x) > hi + tol)
+        keys = list(zip(candidates[violated].tolist(), projects[violated].tolist()))
+        return A[violated], lo[violated], hi[violated], keys
+
+    def violated_rows(self, x):
+        """Returns the violated rows not yet added as (A, lo, hi), or None if there are none
+
+        The rows are recorded as added; pass them to record to add them
+        to the model.
+        """
+        return self._new_rows(*self._violations(x))
+
+    def _new_rows(self, A, lo, hi, keys):
+        new = np.array([key not in self.added for key in keys], dtype=bool)
+        if not new.any():
+            return None
+        self.added.update(key for (key, is_new) in zip(keys, new) if is_new)
+        return A[new], lo[new], hi[new]
+
+    def record(self, A, lo, hi):
+        """Adds separated rows to the model and counts them"""
+        self.model.add_rows(A, lo, hi, 'antiprefs')
+        self.rows_added += A.shape[0]
+        self.rounds += 1
+
+    def separate(self, x):
+        """Adds the rows x violates to the model, returns how many rows x violates
+
+        Solver solutions only violate rows that are not in the model yet,
+        but e.g. pool solutions of an earlier run can violate either kind.
+        """
+        violations = self._violations(x)
+        rows = self._new_rows(*violations)
+        if rows is not None:
+            self.record(*rows)
+        return len(violations[3])
+
+    def summary(self):
+        full = len(self.model.antipref_pairs)*self.model.num_projects
+        return ('Lazy anti-preferences: {added} of {full} rows added in {rounds} rounds'
+                .format(added=self.rows_added, full=full, rounds=self.rounds))
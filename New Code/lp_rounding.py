@@ -0,0 +1,75 @@
+import time
+import numpy as np
+import scipy.sparse as sp
+from scipy.optimize import linprog
+
+from solver_backends import SolveResult
+from min_cost_flow import transportation, flow_costs, staffing_bounds
+from lagrangian import _split_rows, repair
+
+"""
+LP relaxation bound and rounding
+
+For a quick look at an instance without proven optimality: the LP
+relaxation of a MatrixModel (0 <= x <= 1) gives a lower bound, and its
+duals on the anti-preference and GPA rows are the best Lagrangian
+multipliers for those rows (the transportation part is integral). The
+transportation problem with the rows priced in at those duals, ties
+broken towards the LP solution, is solved by min-cost flow, which keeps
+every staffing bound, and the local search repair of lagrangian.py
+fixes any side row it still violates.
+"""
+
+# weight of the LP solution when breaking ties between equally priced pairs
+TIE_BREAK = 1e-3
+
+
+def _lp_rows(model, A_side, b_side):
+    """Returns (A_ub, b_ub, A_eq, b_eq) for linprog, the side rows first in A_ub"""
+    A = model.A.tocsr()
+    core = np.concatenate([model.block('staffing'), model.block('assignment')])
+    lo, hi = model.row_lo[core], model.row_hi[core]
+    equal = lo == hi
+    upper = ~equal & np.isfinite(hi)
+    lower = ~equal & np.isfinite(lo)
+    A_ub = sp.vstack([A_side, A[core[upper]], -A[core[lower]]], format='csr')
+    b_ub = np.concatenate([b_side, hi[upper], -lo[lower]])
+    return A_ub, b_ub, A[core[equal]], hi[equal]
+
+
+def solve_lp_rounding(model):
+    """Solves the LP relaxation of a MatrixModel and rounds it, returns a SolveResult
+
+    result.bound is the LP bound (rounded up for integer costs) and
+    result.gap the relative gap of the rounded assignment to it. Returns
+    None for models with auxiliary columns.
+    """
+    if model.num_vars != model.num_x:
+        return None
+    start = time.time()
+    A_side, b_side = _split_rows(model)
+    A_ub, b_ub, A_eq, b_eq = _lp_rows(model, A_side, b_side)
+    lp = linprog(model.obj, A_ub=A_ub, b_ub=b_ub, A_eq=A_eq, b_eq=b_eq,
+                 bounds=np.column_stack([model.lb, model.ub]), method='highs')
+    if lp.status == 2:
+        return SolveResult('infeasible', solve_time=time.time() - start)
+    if lp.status != 0:
+        return SolveResult('no_solution', solve_time=time.time() - start)
+    bound = lp.fun + model.obj_offset
+    if model.integer_objective:
+        bound = float(np.ceil(bound - 1e-6))
+
+    # transportation with the side rows priced at their duals (marginals are <= 0 for <= rows)
+    lam = np.maximum(-lp.ineqlin.marginals[:len(b_side)], 0)
+    costs = flow_costs(model)
+    priced = costs + model.x_matrix(A_side.T.dot(lam)) - TIE_BREAK*model.x_matrix(lp.x)
+    lower, upper = staffing_bounds(model)
+    assignment = transportation(priced, lower, upper)
+    if assignment is not None:
+        assignment = repair(model, assignment, costs)
+    if assignment is None:
+        return SolveResult('no_solution', bound=bound, solve_time=time.time() - start)
+    x = model.columns(assignment)
+    value = model.objective(x)
+    status = 'optimal' if value <= bound + 1e-9 else 'feasible'
+    return SolveResult(status, x, value, bound, None, time.time() - start)
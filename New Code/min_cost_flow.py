@@ -0,0 +1,264 @@
+import time
+import numpy as np
+
+from solver_backends import SolveResult
+
+"""
+Min-cost flow engine for side-constraint-free assignment models
+
+Without anti-preferences and binding GPA rows, and with locks and bars
+only fixing variables, the model from build_matrix_model is a capacitated
+transportation problem: every student sends one unit of flow to a
+project and project j receives between minstaff and maxstaff units. This
+is solved exactly by successive shortest paths, with no MIP solver.
+
+The solver keeps a price for every project (the node potentials of the
+flow) and puts each student on a project of least cost minus price,
+which is optimal for any prices but may break the staffing bounds. The
+projects over or under their bounds are then evened out along shortest
+paths over the projects only: the edge j->k costs the cheapest move of a
+student currently on j over to k, and a sink node joins the projects
+with room to spare. Each path moves a student along every edge (as
+many at once as the edges allow when their moves cost the same) and
+updates the prices, so only the imbalance is routed, not every student. A
+TransportationSession keeps the prices of its last solve, so repeated
+solves with slightly changed costs (as in lagrangian.py) start nearly
+balanced.
+"""
+
+# costs are compared up to this much when looking for shorter paths
+TOLERANCE = 1e-9
+
+
+def _move_costs(costs, members, j):
+    """Cheapest cost of moving a student on project j to each project, and how many students share it"""
+    num_projects = costs.shape[1]
+    if len(members) == 0:
+        return np.full(num_projects, np.inf), np.zeros(num_projects, dtype=int)
+    delta = costs[members] - costs[members, j][:, None]
+    row = delta.min(axis=0)
+    row[j] = np.inf
+    return row, (delta <= row + TOLERANCE).sum(axis=0)
+
+
+def _movers(costs, members, j, k, count):
+    """count students on project j whose move to k costs least"""
+    delta = costs[members, k] - costs[members, j]
+    return members[np.argsort(delta, kind='stable')[:count]]
+
+
+def _shortest_paths(edges, potential, dist):
+    """Bellman-Ford from the nodes at distance 0 over edge costs reduced by the potentials
+
+    Returns the distances and the predecessor of each node, -1 for the sources.
+    """
+    reduced = edges + potential[:, None] - potential[None, :]
+    pred = np.full(len(dist), -1)
+    frontier = np.flatnonzero(np.isfinite(dist))
+    # only nodes whose distance just improved can improve others
+    while len(frontier):
+        via = dist[frontier][:, None] + reduced[frontier]
+        best = np.argmin(via, axis=0)
+        new_dist = via[best, np.arange(len(dist))]
+        improved = new_dist < dist - TOLERANCE
+        dist[improved] = new_dist[improved]
+        pred[improved] = frontier[best[improved]]
+        frontier = np.flatnonzero(improved)
+    return dist, pred
+
+
+class TransportationSession(object):
+    """Transportation problems over fixed staffing bounds, each warm started from the last one's prices"""
+
+    def __init__(self, lower, upper):
+        self.lower = np.asarray(lower, dtype=float)
+        self.upper = np.asarray(upper, dtype=float)
+        # potentials of the projects and the sink after the last solve
+        self.potential = None
+        # number of shortest paths routed by the last solve
+        self.paths = 0
+
+    def solve(self, costs):
+        """Returns the min-cost assignment vector, or None if infeasible
+
+        costs is an n x p array with np.inf for forbidden pairs.
+        """
+        costs = np.asarray(costs, dtype=float)
+        num_students, num_projects = costs.shape
+        lower = self.lower
+        # no project can take more than every student
+        upper = np.minimum(self.upper, num_students)
+        if (not np.isfinite(costs).any(axis=1).all() or np.any(lower > upper) or
+                lower.sum() > num_students or upper.sum() < num_students):
+            return None
+        sink = num_projects
+        potential = np.zeros(num_projects + 1) if self.potential is None else self.potential.copy()
+
+        # every student on a project of least cost minus price, ties spread
+        # over the projects by starting each student's search at a different one
+        reduced = costs - potential[:sink]
+        tied = reduced <= reduced.min(axis=1)[:, None] + TOLERANCE
+        offset = (np.arange(num_projects)[None, :] - np.arange(num_students)[:, None]) % num_projects
+        assignment = np.argmin(np.where(tied, offset, num_projects), axis=1)
+        load = np.bincount(assignment, minlength=num_projects)
+        # units each project passes to the sink: at a bound where the prices
+        # make that edge one-sided, else as many as fit
+        gap = potential[:sink] - potential[sink]
+        flow = np.where(gap > TOLERANCE, lower, np.where(gap < -TOLERANCE, upper, np.clip(load, lower, upper)))
+
+        # edge costs between the projects and the sink, and how many students
+        # can move along each project edge at that cost
+        edges = np.full((num_projects + 1, num_projects + 1), np.inf)
+        movable = np.zeros((num_projects, num_projects), dtype=int)
+        for j in range(num_projects):
+            edges[j, :sink], movable[j] = _move_costs(costs, np.flatnonzero(assignment == j), j)
+
+        self.paths = 0
+        while True:
+            excess = np.append(load - flow, flow.sum() - num_students)
+            if not np.any(excess > 0):
+                break
+            edges[:sink, sink] = np.where(flow < upper, 0.0, np.inf)
+            edges[sink, :sink] = np.where(flow > lower, 0.0, np.inf)
+            dist, pred = _shortest_paths(edges, potential, np.where(excess > 0, 0.0, np.inf))
+            end = np.flatnonzero(excess < 0)[np.argmin(dist[excess < 0])]
+            if not np.isfinite(dist[end]):
+                return None
+            potential += np.minimum(dist, dist[end])
+            self.paths += 1
+
+            # the path back to its source, and how much it can carry
+            path = [end]
+            while pred[path[-1]] != -1:
+                path.append(pred[path[-1]])
+            path.reverse()
+            amount = min(excess[path[0]], -excess[end])
+            for (j, k) in zip(path[:-1], path[1:]):
+                if j == sink:
+                    amount = min(amount, flow[k] - lower[k])
+                elif k == sink:
+                    amount = min(amount, upper[j] - flow[j])
+                else:
+                    amount = min(amount, movable[j, k])
+            amount = int(amount)
+
+            # pick every mover before moving anyone, so no student moves twice
+            moves = []
+            for (j, k) in zip(path[:-1], path[1:]):
+                if j == sink:
+                    flow[k] -= amount
+                elif k == sink:
+                    flow[j] += amount
+                else:
+                    moves.append((j, k, _movers(costs, np.flatnonzero(assignment == j), j, k, amount)))
+            for (j, k, students) in moves:
+                assignment[students] = k
+                load[j] -= amount
+                load[k] += amount
+            for j in set(j for move in moves for j in move[:2]):
+                edges[j, :sink], movable[j] = _move_costs(costs, np.flatnonzero(assignment == j), j)
+
+        self.potential = potential
+        return assignment
+
+
+def transportation(costs, lower, upper):
+    """Returns the min-cost assignment vector, or None if infeasible
+
+    costs is an n x p array with np.inf for forbidden pairs, lower and
+    upper are the per-project staffing bounds (upper may be np.inf).
+    """
+    return TransportationSession(lower, upper).solve(costs)
+
+
+def _project_row_redundant(vals, lo, hi, count_lo, count_hi):
+    """Whether lo <= vals*x <= hi holds for every 0/1 x with count_lo <= sum(x) <= count_hi"""
+    vals = np.sort(vals)[::-1]
+    count_hi = int(min(count_hi, len(vals)))
+    count_lo = int(max(count_lo, 0))
+    # largest activity: every positive coefficient up to count_hi, topped up to count_lo
+    take = min(max(int((vals > 0).sum()), count_lo), count_hi)
+    if np.isfinite(hi) and vals[:take].sum() > hi + 1e-9:
+        return False
+    # smallest activity, symmetrically
+    take = min(max(int((vals < 0).sum()), count_lo), count_hi)
+    if np.isfinite(lo) and vals[::-1][:take].sum() < lo - 1e-9:
+        return False
+    return True
+
+
+def flow_costs(model):
+    """Preference costs of a MatrixModel as an n x p array, np.inf where x[i,j] is fixed to 0"""
+    costs = model.x_matrix(model.obj, np.inf)
+    costs[model.x_matrix(model.ub, 0) < 0.5] = np.inf
+    # a student fixed by bounds can only go to that project
+    fixed = model.x_matrix(model.lb, 0) > 0.5
+    fixed_rows = np.flatnonzero(fixed.any(axis=1))
+    costs[fixed_rows] = np.where(fixed[fixed_rows], costs[fixed_rows], np.inf)
+    # locked students have no columns; their cost is in the objective offset
+    locked = np.flatnonzero(model.fixed_project >= 0)
+    costs[locked] = np.inf
+    costs[locked, model.fixed_project[locked]] = 0
+    return costs
+
+
+def staffing_bounds(model):
+    """Lower and upper staffing bound of each project of a MatrixModel, locked students included"""
+    # the builder emits one staffing row per project, in project order,
+    # with the places of locked students taken off
+    staffing = model.block('staffing')
+    locked = model.fixed_project[model.fixed_project >= 0]
+    locked_count = np.bincount(locked, minlength=model.num_projects)
+    return (np.maximum(model.row_lo[staffing] + locked_count, 0),
+            model.row_hi[staffing] + locked_count)
+
+
+def flow_instance(model):
+    """Returns (costs, lower, upper) if the MatrixModel is a transportation problem, else None
+
+    Rows outside the staffing and assignment blocks (anti-preferences,
+    GPA, cuts) are allowed only if they involve a single project and no
+    staffing level of that project can violate them.
+    """
+    if model.num_vars != model.num_x:
+        return None
+    costs = flow_costs(model)
+    lower, upper = staffing_bounds(model)
+    allowed = np.isfinite(costs).sum(axis=0)
+
+    side = np.setdiff1d(np.arange(model.num_rows),
+                        np.concatenate([model.block('staffing'), model.block('assignment')]))
+    A = model.A.tocsr()
+    for r in side:
+        cols = A.indices[A.indptr[r]:A.indptr[r+1]]
+        vals = A.data[A.indptr[r]:A.indptr[r+1]]
+        if len(cols) == 0:
+            continue
+        projects = np.unique(model.var_project[cols])
+        if len(projects) != 1:
+            return None
+        j = projects[0]
+        open_cols = np.isfinite(costs[model.var_student[cols], model.var_project[cols]])
+        # students of j outside this row can make up part of the staffing level
+        others = allowed[j] - open_cols.sum()
+        if not _project_row_redundant(vals[open_cols], model.row_lo[r], model.row_hi[r],
+                                      lower[j] - others, upper[j]):
+            return None
+    return costs, lower, upper
+
+
+def solve_flow(model):
+    """Solves a transportation MatrixModel by min-cost flow, returns a SolveResult
+
+    Returns None if the model has side constraints (see flow_instance).
+    """
+    start = time.time()
+    instance = flow_instance(model)
+    if instance is None:
+        return None
+    assignment = transportation(*instance)
+    if assignment is None:
+        return SolveResult('infeasible', solve_time=time.time() - start)
+    x = model.columns(assignment)
+    obj_value = model.objective(x)
+    return SolveResult('optimal', x, obj_value, obj_value, 0, time.time() - start)
@@ -0,0 +1,413 @@
+import numpy as np
+import scipy.sparse as sp
+import cvxopt as cvx
+import picos as pic
+from picos.expressions import AffineExpression
+
+from optimizeIP_repeat import ANTIPREF_COST, GPA_COST
+from antipref_cliques import conflict_edges, clique_cover
+
+"""
+Matrix-form integer programming formulation for team selection
+
+Builds the same model as optimize_repeat in optimizeIP_repeat.py, but
+assembles the objective and every constraint block as sparse coefficient
+matrices in one vectorized pass instead of one PICOS expression per row.
+
+Only allowed (student, project) pairs get an x column: barred and
+citizenship-banned pairs never exist, and locked students are taken out
+of the problem, with their places taken off the staffing bounds, their
+cost moved into a constant objective offset and their part of every
+other row moved into its bounds. The x columns come in row-major order
+of the allowed pairs, followed by y1, y2 and z when allow_antiprefs_gpa
+is set. Rows are row_lo <= A*x <= row_hi.
+"""
+
+
+class MatrixModel(object):
+    """Sparse assignment model: min obj*x + obj_offset  s.t.  row_lo <= A*x <= row_hi, lb <= x <= ub, x binary"""
+
+    def __init__(self, num_students, num_projects, col_index, obj, lb, ub, A, row_lo, row_hi, row_blocks,
+                 antipref_pairs=None, fixed_project=None, obj_offset=0.0):
+        self.num_students = num_students
+        self.num_projects = num_projects
+        # col_index[i,j] is the column of x[i,j], -1 if the pair has no column
+        self.col_index = col_index
+        stu, proj = np.nonzero(col_index >= 0)
+        self.num_x = len(stu)
+        # student and project of each x column
+        self.var_student = np.empty(self.num_x, dtype=int)
+        self.var_project = np.empty(self.num_x, dtype=int)
+        self.var_student[col_index[stu, proj]] = stu
+        self.var_project[col_index[stu, proj]] = proj
+        # project of each locked student, -1 for the others
+        if fixed_project is None:
+            fixed_project = -np.ones(num_students, dtype=int)
+        self.fixed_project = fixed_project
+        self.obj = obj
+        self.obj_offset = obj_offset
+        self.lb = lb
+        self.ub = ub
+        self.A = A
+        self.row_lo = row_lo
+        self.row_hi = row_hi
+        # list of (name, first row, last row + 1) for each constraint block
+        self.row_blocks = row_blocks
+        # (shooter, target) student pairs of every anti-preference bullet
+        if antipref_pairs is None:
+            antipref_pairs = np.zeros((0, 2), dtype=int)
+        self.antipref_pairs = antipref_pairs
+
+    @property
+    def num_vars(self):
+        return self.A.shape[1]
+
+    @property
+    def num_rows(self):
+        return self.A.shape[0]
+
+    @property
+    def nnz(self):
+        return self.A.nnz
+
+    @property
+    def free_students(self):
+        """Indices of the students that are not locked"""
+        return np.flatnonzero(self.fixed_project < 0)
+
+    @property
+    def integer_objective(self):
+        """Whether every solution has an integer objective value"""
+        return bool(np.all(self.obj == np.round(self.obj)) and self.obj_offset == np.round(self.obj_offset))
+
+    def objective(self, x):
+        """Objective value of a column vector, locked students included"""
+        return float(np.dot(self.obj, x) + self.obj_offset)
+
+    def x_matrix(self, values, fill=0.0):
+        """Spreads per-column values over an n x p array, fill where a pair has no column"""
+        out = np.full((self.num_students, self.num_projects), fill, dtype=float)
+        exists = self.col_index >= 0
+        out[exists] = np.asarray(values)[self.col_index[exists]]
+        return out
+
+    def add_rows(self, A_new, lo, hi, name='cuts'):
+        """Appends the rows lo <= A_new*x <= hi as a new block"""
+        start = self.num_rows
+        self.A = sp.vstack([self.A, sp.csr_matrix(A_new)], format='csr')
+        self.row_lo = np.concatenate([self.row_lo, np.atleast_1d(np.asarray(lo, dtype=float))])
+        self.row_hi = np.concatenate([self.row_hi, np.atleast_1d(np.asarray(hi, dtype=float))])
+        self.row_blocks.append((name, start, self.num_rows))
+
+    def antipref_rows(self, pairs, projects):
+        """Returns x[i,j] + x[k,j] (- y1_i) <= 1 for each (pair index, project) as (A, lo, hi)"""
+        pairs = np.asarray(pairs, dtype=int)
+        projects = np.asarray(projects, dtype=int)
+        rows, cols, vals, constant = _antipref_coords(self.col_index, self.fixed_project,
+                                                      self.antipref_pairs[pairs, 0], self.antipref_pairs[pairs, 1],
+                                                      projects, self.num_x if self.num_vars != self.num_x else None)
+        num_rows = len(pairs)
+        A = sp.csr_matrix((vals, (rows, cols)), shape=(num_rows, self.num_vars))
+        return A, np.full(num_rows, -np.inf), 1 - constant
+
+    def block(self, name):
+        """Returns the row indices of every block with the given name"""
+        return np.concatenate([np.arange(start, stop) for (block_name, start, stop) in self.row_blocks
+                               if block_name == name] + [np.zeros(0, dtype=int)])
+
+    def add_no_good_cut(self, assignment, min_distance=1):
+        """Adds sum_i x[i,assignment[i]] <= n-min_distance over the free students
+
+        With min_distance 1 this cuts off exactly this assignment; in
+        general every remaining solution moves at least min_distance
+        students away from it.
+        """
+        free = self.free_students
+        cols = self.col_index[free, np.asarray(assignment)[free]]
+        row = sp.csr_matrix((np.ones(len(cols)), (np.zeros(len(cols), dtype=int), cols)),
+                            shape=(1, self.num_vars))
+        self.add_rows(row, -np.inf, len(free) - min_distance, 'cuts')
+
+    def is_feasible(self, x, tol=1e-6):
+        """Whether a column vector satisfies every bound and row"""
+        activity = self.A.dot(x)
+        return bool(np.all(x >= self.lb - tol) and np.all(x <= self.ub + tol) and
+                    np.all(activity >= self.row_lo - tol) and np.all(activity <= self.row_hi + tol))
+
+    def columns(self, assignment):
+        """Converts an assignment vector into a column vector (x only)"""
+        free = self.free_students
+        cols = self.col_index[free, np.asarray(assignment)[free]]
+        x = np.zeros(self.num_vars)
+        x[cols[cols >= 0]] = 1
+        return x
+
+    def assignment(self, x):
+        """Converts a column vector into an assignment vector of project indices"""
+        assignment = np.argmax(self.x_matrix(x, -1.0), axis=1)
+        locked = self.fixed_project >= 0
+        assignment[locked] = self.fixed_project[locked]
+        return assignment
+
+
+def _x_terms(col_index, fixed_project, rows, students, projects, vals, num_rows):
+    """Splits coefficients on x[students, projects] into entries for existing columns
+    and the constant that locked students add to each row
+
+    Returns (rows, cols, vals, constant) with constant of length num_rows.
+    """
+    cols = col_index[students, projects]
+    locked = fixed_project[students] == projects
+    constant = np.bincount(rows[locked], weights=vals[locked], minlength=num_rows)
+    keep = cols >= 0
+    return rows[keep], cols[keep], vals[keep], constant
+
+
+def _antipref_coords(col_index, fixed_project, src, dst, proj, y1_start=None):
+    """Coordinates of the rows x[src,proj] + x[dst,proj] (- y1_src) <= 1, one row per entry
+
+    Returns (rows, cols, vals, constant) as _x_terms does.
+    """
+    num_rows = len(src)
+    rows, cols, vals, constant = _x_terms(col_index, fixed_project, np.tile(np.arange(num_rows), 2),
+                                          np.concatenate([src, dst]), np.tile(proj, 2),
+                                          np.ones(2*num_rows), num_rows)
+    if y1_start is not None:
+        rows = np.concatenate([rows, np.arange(num_rows)])
+        cols = np.concatenate([cols, y1_start + src])
+        vals = np.concatenate([vals, -np.ones(num_rows)])
+    return rows, cols, vals, constant
+
+
+def _drop_empty_rows(rows, cols, vals, lo, hi):
+    """Drops rows without coefficients that every x satisfies and renumbers the rest"""
+    count = np.bincount(rows, minlength=len(lo))
+    keep = (count > 0) | (lo > 0) | (hi < 0)
+    new_index = np.cumsum(keep) - 1
+    return new_index[rows], cols, vals, lo[keep], hi[keep]
+
+
+def build_matrix_model(project_index, token_index, name_fuzzy, penalties, minstaff_projects, maxstaff_projects,
+                       antiprefs_dict_1, antiprefs_dict_2, stu_gpa_indic, locked_students,
+                       barred_students, citizen_bans, allow_antiprefs_gpa=False, lazy_antiprefs=False,
+                       antipref_cliques=False, max_cost=None):
+    """Builds the optimize_repeat model as a MatrixModel
+
+    With lazy_antiprefs the anti-preference rows are left out; the pairs
+    are kept in model.antipref_pairs for lazy_antiprefs.LazyAntiprefs.
+    With antipref_cliques the pair rows are replaced by one row per clique
+    of the conflict graph and project (see antipref_cliques.py); soft
+    anti-preferences (allow_antiprefs_gpa) keep the pair rows. With
+    max_cost, pairs costing max_cost or more get no column, unless that
+    would leave a student with no project at all. max_cost may be given as
+    a string, like the PREF_COST constants.
+    """
+
+    num_students = len(token_index)
+    num_projects = len(project_index)
+    penalties = np.asarray(penalties, dtype=float)
+
+    # locked students leave the problem, barred and banned pairs never exist
+    fixed_project = -np.ones(num_students, dtype=int)
+    for (stu_name, project_name) in locked_students:
+        i = token_index[name_fuzzy[stu_name]]
+        if fixed_project[i] not in (-1, project_index[project_name]):
+            raise ValueError('%s is locked to two projects' % stu_name)
+        fixed_project[i] = project_index[project_name]
+    allowed = np.ones((num_students, num_projects), dtype=bool)
+    for (stu_name, project_name) in barred_students:
+        allowed[token_index[name_fuzzy[stu_name]], project_index[project_name]] = False
+    for (token, project_name) in citizen_bans:
+        allowed[token_index[token], project_index[project_name]] = False
+    locked = np.flatnonzero(fixed_project >= 0)
+    conflicts = locked[~allowed[locked, fixed_project[locked]]]
+    if len(conflicts) > 0:
+        raise ValueError('students %s are barred from the project they are locked to' % conflicts.tolist())
+    allowed[locked] = False
+    if max_cost is not None:
+        cheap = allowed & (penalties < float(max_cost))
+        allowed = np.where(cheap.any(axis=1)[:, None], cheap, allowed)
+
+    col_index = -np.ones((num_students, num_projects), dtype=int)
+    col_index[allowed] = np.arange(allowed.sum())
+    # student and project of each x column, in column order
+    var_student, var_project = np.nonzero(allowed)
+    num_x = len(var_student)
+    free = np.flatnonzero(fixed_project < 0)
+
+    # auxiliary columns follow x: y1 and y2 per student, z per project
+    if allow_antiprefs_gpa:
+        y1_start = num_x
+        y2_start = y1_start + num_students
+        z_start = y2_start + num_students
+        num_vars = z_start + num_projects
+    else:
+        num_vars = num_x
+
+    # objective, with the cost of the locked students as a constant
+    obj = np.zeros(num_vars)
+    obj[:num_x] = penalties[allowed]
+    obj_offset = float(penalties[locked, fixed_project[locked]].sum())
+    if allow_antiprefs_gpa:
+        obj[y1_start:z_start] = ANTIPREF_COST
+        obj[z_start:] = GPA_COST
+
+    # each block is a (rows, cols, vals, lo, hi) tuple in coordinate form
+    blocks = []
+
+    # staffing: minstaff <= sum_i x_ij <= maxstaff, one ranged row per project,
+    # less the places taken by locked students
+    staff_lo = np.full(num_projects, -np.inf)
+    staff_hi = np.full(num_projects, np.inf)
+    for proj_name in minstaff_projects.keys():
+        staff_lo[project_index[proj_name]] = minstaff_projects[proj_name]
+    for proj_name in maxstaff_projects.keys():
+        staff_hi[project_index[proj_name]] = maxstaff_projects[proj_name]
+    locked_count = np.bincount(fixed_project[locked], minlength=num_projects)
+    blocks.append(('staffing', var_project, np.arange(num_x), np.ones(num_x),
+                   staff_lo - locked_count, staff_hi - locked_count))
+
+    # assignment: sum_j x_ij == 1 for every free student
+    free_row = -np.ones(num_students, dtype=int)
+    free_row[free] = np.arange(len(free))
+    blocks.append(('assignment', free_row[var_student], np.arange(num_x), np.ones(num_x),
+                   np.ones(len(free)), np.ones(len(free))))
+
+    # anti-preferences: x_ij + x_kj (- y1_i) <= 1 for every pair and project
+    # as in optimize_repeat, rows for both bullets are charged to y1
+    antipref_pairs = []
+    for antiprefs_dict in (antiprefs_dict_1, antiprefs_dict_2):
+        src = np.fromiter(antiprefs_dict.keys(), dtype=int, count=len(antiprefs_dict))
+        dst = np.fromiter(antiprefs_dict.values(), dtype=int, count=len(antiprefs_dict))
+        antipref_pairs.append(np.column_stack([src, dst]))
+        if lazy_antiprefs or (antipref_cliques and not allow_antiprefs_gpa):
+            continue
+        num_pairs = len(src)
+        num_rows = num_pairs*num_projects
+        # rows are ordered project-major, as in optimize_repeat
+        pair = np.tile(np.arange(num_pairs), num_projects)
+        proj = np.repeat(np.arange(num_projects), num_pairs)
+        rows, cols, vals, constant = _antipref_coords(col_index, fixed_project, src[pair], dst[pair], proj,
+                                                      y1_start if allow_antiprefs_gpa else None)
+        blocks.append(('antiprefs',) + _drop_empty_rows(rows, cols, vals, np.full(num_rows, -np.inf),
+                                                        1 - constant))
+
+    # anti-preference cliques: sum_{i in C} x_ij <= 1 for every clique and project
+    if antipref_cliques and not allow_antiprefs_gpa and not lazy_antiprefs:
+        cliques = clique_cover(conflict_edges(np.concatenate(antipref_pairs)))
+        members = np.concatenate(cliques + [np.zeros(0, dtype=int)]).astype(int)
+        clique_of = np.repeat(np.arange(len(cliques)), [len(clique) for clique in cliques])
+        num_rows = len(cliques)*num_projects
+        # rows are ordered project-major, like the pair rows
+        proj = np.repeat(np.arange(num_projects), len(members))
+        rows, cols, vals, constant = _x_terms(col_index, fixed_project,
+                                              np.tile(clique_of, num_projects) + proj*len(cliques),
+                                              np.tile(members, num_projects), proj, np.ones(len(proj)), num_rows)
+        blocks.append(('antiprefs',) + _drop_empty_rows(rows, cols, vals, np.full(num_rows, -np.inf),
+                                                        1 - constant))
+
+    # GPA: sum_i (indic_i - 0.5) x_ij (- z_j) <= 0
+    gpa_sub_array = np.asarray(stu_gpa_indic, dtype=float) - 0.5
+    rows, cols, vals, constant = _x_terms(col_index, fixed_project, np.tile(np.arange(num_projects), num_students),
+                                          np.repeat(np.arange(num_students), num_projects),
+                                          np.tile(np.arange(num_projects), num_students),
+                                          np.repeat(gpa_sub_array, num_projects), num_projects)
+    rows, cols, vals = [rows], [cols], [vals]
+    if allow_antiprefs_gpa:
+        rows.append(np.arange(num_projects))
+        cols.append(z_start + np.arange(num_projects))
+        vals.append(-np.ones(num_projects))
+    blocks.append(('gpa', np.concatenate(rows), np.concatenate(cols), np.concatenate(vals),
+                   np.full(num_projects, -np.inf), -constant))
+
+    # stack the blocks into a single CSR matrix
+    row_offset = 0
+    all_rows, all_cols, all_vals, all_lo, all_hi, row_blocks = [], [], [], [], [], []
+    for (name, rows, cols, vals, lo, hi) in blocks:
+        all_rows.append(rows + row_offset)
+        all_cols.append(cols)
+        all_vals.append(vals)
+        all_lo.append(lo)
+        all_hi.append(hi)
+        row_blocks.append((name, row_offset, row_offset + len(lo)))
+        row_offset += len(lo)
+    A = sp.csr_matrix((np.concatenate(all_vals), (np.concatenate(all_rows), np.concatenate(all_cols))),
+                      shape=(row_offset, num_vars))
+
+    return MatrixModel(num_students, num_projects, col_index, obj, np.zeros(num_vars), np.ones(num_vars), A,
+                       np.concatenate(all_lo).astype(float), np.concatenate(all_hi).astype(float), row_blocks,
+                       np.concatenate(antipref_pairs).astype(int), fixed_project, obj_offset)
+
+
+def _to_cvxopt(A):
+    """Converts a scipy sparse matrix to a cvxopt one without densifying"""
+    A = sp.coo_matrix(A)
+    return cvx.spmatrix(cvx.matrix(A.data.astype(float)), cvx.matrix(A.row.astype(int)),
+                        cvx.matrix(A.col.astype(int)), A.shape)
+
+
+def to_picos(model):
+    """Hands a MatrixModel to PICOS in bulk, returns the problem and an x expression"""
+
+    prob = pic.Problem()
+    # a single vector variable over all columns
+    columns = pic.BinaryVariable('x', model.num_vars)
+
+    # pass each coefficient matrix straight to PICOS as a linear map on the
+    # columns, which avoids PICOS's per-element constant handling
+    def linear(name, A, shape=None, constant=None):
+        coefficients = {columns: _to_cvxopt(A)}
+        if constant is not None:
+            coefficients[()] = cvx.matrix(np.asarray(constant, dtype=float))
+        return AffineExpression(name, shape or (A.shape[0], 1), coefficients)
+
+    # the n x p matrix of x[i,j], entry (i,j) at i + j*n in PICOS's column-major
+    # order: a column where the pair exists, 1 for the project of a locked student
+    n, p = model.num_students, model.num_projects
+    stu, proj = np.nonzero(model.col_index >= 0)
+    selector = sp.csr_matrix((np.ones(len(stu)), (stu + proj*n, model.col_index[stu, proj])),
+                             shape=(n*p, model.num_vars))
+    locked = np.flatnonzero(model.fixed_project >= 0)
+    constant = np.zeros(n*p)
+    constant[locked + model.fixed_project[locked]*n] = 1
+    stu_to_proj = linear('x', selector, (n, p), constant)
+
+    # one vector constraint per kind of row bound
+    A = model.A.tocsr()
+    lo, hi = model.row_lo, model.row_hi
+    equal = lo == hi
+    for rows, sense in ((np.flatnonzero(equal), '=='),
+                        (np.flatnonzero(~equal & np.isfinite(hi)), '<='),
+                        (np.flatnonzero(~equal & np.isfinite(lo)), '>=')):
+        if len(rows) == 0:
+            continue
+        expr = linear('A' + sense, A[rows])
+        if sense == '==':
+            prob.add_constraint(expr == hi[rows])
+        elif sense == '<=':
+            prob.add_constraint(expr <= hi[rows])
+        else:
+            prob.add_constraint(expr >= lo[rows])
+
+    # variable fixings
+    fixed_one = np.flatnonzero(model.lb > 0)
+    fixed_zero = np.flatnonzero(model.ub < 1)
+    for cols, value in ((fixed_one, 1), (fixed_zero, 0)):
+        if len(cols) > 0:
+            selector = sp.csr_matrix((np.ones(len(cols)), (np.arange(len(cols)), cols)),
+                                     shape=(len(cols), model.num_vars))
+            prob.add_constraint(linear('fixed', selector) == value)
+
+    prob.set_objective('min', linear('cost', sp.csr_matrix(model.obj), constant=[model.obj_offset]))
+    return prob, stu_to_proj
+
+
+def optimize_matrix(project_index, token_index, name_fuzzy, penalties, minstaff_projects, maxstaff_projects,
+                    antiprefs_dict_1, antiprefs_dict_2, stu_gpa_indic, locked_students,
+                    barred_students, citizen_bans, allow_antiprefs_gpa=False):
+    """Drop-in replacement for optimize_repeat built from sparse matrices"""
+
+    model = build_matrix_model(project_index, token_index, name_fuzzy, penalties, minstaff_projects,
+                               maxstaff_projects, antiprefs_dict_1, antiprefs_dict_2, stu_gpa_indic,
+                               locked_students, barred_students, citizen_bans, allow_antiprefs_gpa)
+    return to_picos(model)
@@ -1,11 +1,23 @@
 import numpy as np
-import pandas as pd
-import picos as pic
-from optimizeIP_repeat import optimize_repeat
+from optimizeIP_matrix import build_matrix_model
+from solver_backends import BACKENDS, get_backend
+from enumerate_solutions import cut_loop, pool_loop, diverse_loop, until_interrupted
+from diversity import distance_matrix, DiverseSelector, StreamingDiverseSet
+from min_cost_flow import solve_flow
+from lazy_antiprefs import LazyAntiprefs
+from lagrangian import solve_lagrangian
+from lp_rounding import solve_lp_rounding
+from kbest import kbest
+from time_budget import TimeBudget
+from instrumentation import Metrics
+from ingest import read_cohort
+from antipref_resolution import resolve_bullets
+from alias_store import AliasStore
+from compile_cache import CACHE_DIR, cache_key, load_instance, save_instance
+from optimizeIP_repeat import ANTIPREF_COST, GPA_COST
 import time
-import string
 
-from fuzzy3 import FuzzyDict
+from fuzzy3 import IndexedFuzzyDict
 
 """
 Optimization using integer programming formulation with PICOS
@@ -99,105 +111,261 @@ PREF_COST_1 = '10000'
 # Low GPA bar
 MIN_GPA = 3.0 # we can change this later to 10th percentile, this is a default
 
+# Match ratio (0 to 1) below which a typed name is not taken for a student's name,
+# for anti-preferences and locked or barred students (see fuzzy3.py)
+NAME_CUTOFF = 0.6
+
 # Maximum number of solutions to extract from the integer program
-# this will ask gurobi to find the top # best solutions
+# this will ask the solver to find the top # best solutions
 SOLUTION_LIMIT = 100
 
+# Solver backend: 'highs' (default), 'cbc', 'glpk' or 'gurobi', see solver_backends.py
+SOLVER = 'highs'
+# Solver threads, time limit per solve (seconds) and relative MIP gap, None for solver defaults
+SOLVER_THREADS = None
+SOLVER_TIME_LIMIT = None
+SOLVER_MIP_GAP = None
+# Total time for all solves of a run in seconds, shared out between the solves, with
+# SOLVER_TIME_LIMIT as the most a single solve gets (see time_budget.py); the run stops
+# with the solutions found so far once it is used up. None for no budget
+TIME_BUDGET = None
+# Keep one live solver model between solves and warm start it (see enumerate_solutions.py),
+# False rebuilds the model for every solution
+INCREMENTAL_SOLVE = True
+# Ask the solver for a pool of the top SOLUTION_LIMIT solutions in a single run where it
+# supports that (gurobi), otherwise fall back to the cut loop
+SOLUTION_POOL = True
+# Every solution moves at least this many students compared to each earlier one, so a
+# few solves already give distinct options; 1 enumerates the top solutions exactly
+MIN_DISTANCE = 1
+# Number of processes for the partitioned k-best search (see kbest.py), which solves about
+# one subproblem per student for every solution, in parallel; it only pays off on many cores
+# and runs the cut loop with fewer than 2 or more than os.cpu_count() workers. None for the
+# cut loop. Not combined with LAZY_ANTIPREFS or MIN_DISTANCE > 1
+KBEST_WORKERS = None
+# Number of processes scoring anti-preference names against the roster on large
+# surveys (see antipref_resolution.py); None for one per CPU
+NAME_WORKERS = None
+# Keep the fuzzy matches of bullet names in an alias table for later runs, reviewed and
+# overridden with python alias_store.py (see alias_store.py); False to match every run
+ALIAS_TABLE = True
+# Solve models without anti-preferences or binding GPA rows by min-cost flow instead
+# of the MIP solver (see min_cost_flow.py); later solutions still come from the solver
+FLOW_FAST_PATH = True
+# 'mip' for the top SOLUTION_LIMIT solutions from the solver, 'lagrangian' for a single
+# near-optimal solution with a lower bound and gap from Lagrangian relaxation of the
+# anti-preference and GPA rows (see lagrangian.py), no solver needed, 'diverse' for the
+# optimum and then DIVERSE_LIMIT-1 solutions within DIVERSE_GAP of it that overlap as
+# little as possible with the ones before (optimizeTeams in team_assignment/optimize_teams.R),
+# 'lp' for a quick look: the LP relaxation bound and its rounding to one feasible assignment
+# by min-cost flow and repair (see lp_rounding.py), no MIP solver needed
+SOLVER_MODE = 'mip'
+# In 'mip' mode, leave the anti-preference rows out and add only those a solution
+# violates (see lazy_antiprefs.py), which keeps the model small for large surveys.
+# Only with backends that add them in a solver callback (gurobi): any other backend
+# would re-solve the whole model after every round, many times slower than all rows
+LAZY_ANTIPREFS = False
+# One row per clique of students who all named each other and project, instead of one
+# row per bullet and project (see antipref_cliques.py)
+ANTIPREF_CLIQUES = True
+# Create no variable for (student, project) pairs costing this much or more, e.g.
+# PREF_COST_1 to drop every "No"; None keeps every pair that is not barred or banned
+MAX_PREF_COST = None
+# Reuse the compiled instance and model from CACHE_DIR when the data files and every
+# constant above are unchanged (see compile_cache.py)
+COMPILE_CACHE = True
+
 # Maximum number of solutions to take that are pairwise most diverse
 DIVERSE_LIMIT = 10
+# In 'diverse' mode, relative gap to the optimal preference cost every solution stays within
+DIVERSE_GAP = 0.05
+# Rows of the solution distance matrix computed at a time (see diversity.py); smaller
+# blocks use less memory for large SOLUTION_LIMIT
+DISTANCE_BLOCK_SIZE = 2048
+# Distance between two solutions: 'hamming' for the number of students on different
+# projects, 'comembership' for the number of student pairs on one team in one solution
+# but not the other, whatever the projects (see diversity.py)
+DIVERSITY_METRIC = 'hamming'
+# How diverse solutions are picked (see diversity.py): 'max_sum' for the largest total
+# distance to those already picked, 'max_min' for the largest distance to the nearest
+# one, 'weighted' for the largest mean distance minus DIVERSE_COST_WEIGHT times the
+# objective value above the best solution's
+DIVERSE_OBJECTIVE = 'max_sum'
+DIVERSE_COST_WEIGHT = 1.0
+# Keep the diverse set up to date while solutions arrive instead of picking it from the
+# full distance matrix afterwards, so an interrupted or time-limited run still has one.
+# Swaps in newcomers for 'max_sum' or 'max_min' (see diversity.py)
+STREAMING_DIVERSITY = False
 
 ####################### Reading and Processing the Data ###########################
 
-# Extract data from survey_anon.csv, token used as index column
-df_survey = pd.read_csv(SURVEY_FILE, index_col='Token', sep=",")
-
-# Extract data from students_anon.csv, ID Number (same as token) used as index column
-df_student = pd.read_csv(STUDENT_FILE, index_col='ID Number', sep=",")
-df_student= df_student.apply(lambda x: x.str.strip() if x.dtype == "object" else x)
-
-# Create list of student tokens and an index array for IP (use row index for consistency)
-# Also create a fuzzy dictionary from student name to token
-num_students = df_survey.shape[0]
-tokens = []
-token_index = dict()
-name_fuzzy = FuzzyDict(cutoff=0.6)
-i = 0
-for index, _ in df_student.iterrows():
-    first = df_student.at[index, 'First Name']
-    last = df_student.at[index, 'Last Name']
-    name = first+" "+last
-    name_fuzzy[name] = index
-    tokens.append(index)
-    token_index[index] = i
-    i += 1
+# phase timings, solves and model size, written to Metrics/ at the end (see instrumentation.py)
+metrics = Metrics()
+metrics.begin('read')
 
 # Create dictionary for penalties
 # TODO: revise dictionaries to reflect penalties above for sensitivity analysis if not already done so
 penalty_dict = {1: PREF_COST_1, 2: PREF_COST_2, 3: PREF_COST_3, 4: PREF_COST_4, 5: PREF_COST_5}
 
-# Manipulation of preferences to map to penalties and store in a numpy array
-df_penalty = np.zeros((num_students,num_projects))
-for token in tokens:
-    for j in range(num_projects):
-        project = SURVEY_PROJECT_COLS[j]
-        df_penalty[token_index[token],j] = penalty_dict[df_survey.at[token,project]]   
-penalties = df_penalty.astype(np.int)
-#print(penalties)
-
-# Create dictionary of antiprefs:
-# Index of token (student shooting bullet) to index of token (student receiving bullet)
-antiprefs_dict_1 = {}
-antiprefs_dict_2 = {}
-
-for token in tokens:
-    token_row = token_index[token]
-    # obtain antipref tokens
-    a1 = df_survey.at[token, 'bullets [1]']
-    a2 = df_survey.at[token, 'bullets [2]']
-    # find the index at which the antiprefs reside
-    # revise antiprefs accordingly
-    if pd.notnull(a1):
-        antiprefs_dict_1[token_row] = token_index[name_fuzzy[a1]]
-    if pd.notnull(a2):
-        antiprefs_dict_2[token_row] = token_index[name_fuzzy[a2]]
-
-# Get student GPAs and mark if below MIN_GPA
-stu_gpas_np = df_student['Cumulative GPA'].values
-# Optionally alter MIN_GPA to 10th percentile of GPAs
-#MIN_GPA = np.percentile(stu_gpas_np, 10)
-stu_gpa_indic = [1 if indiv_gpa <= MIN_GPA else 0 for indiv_gpa in stu_gpas_np]
-
-# Add non-citizens or visa holder banned assignments
-citizen_bans = []
-#for token in tokens:
-#    # Obtain citizenship and visa status
-#    ctzn_status = df_student.at[token, 'Citizenship Description']
-#    visa_status = df_student.at[token, 'Visa Description']
-#    # If not a citizen then ban from citizenship required projects
-#    if ctzn_status != 'UNITED STATES':
-#        for project in CITIZEN_REQ:
-#            citizen_bans.append((token,project))
-#    if (ctzn_status != 'UNITED STATES') and (visa_status != 'Blank'):
-#        for project in VISA_REQ:
-#            citizen_bans.append((token,project))
+# Extract data from survey_anon.csv (token as index) and students_anon.csv (ID Number, same as
+# token, as index), survey rows aligned to the student rows (see ingest.py)
+cohort = read_cohort(SURVEY_FILE, STUDENT_FILE, SURVEY_PROJECT_COLS, penalty_dict)
+df_survey = cohort.survey
+df_student = cohort.students
+
+# Create list of student tokens and an index array for IP (use row index for consistency)
+# Also create a fuzzy dictionary from student name to token
+num_students = len(cohort.tokens)
+tokens = cohort.tokens.tolist()
+token_index = cohort.token_index
+name_fuzzy = IndexedFuzzyDict(cutoff=NAME_CUTOFF)
+name_fuzzy.update(zip(cohort.names.tolist(), tokens))
+alias_store = AliasStore() if ALIAS_TABLE else None
+
+metrics.begin('instance')
+lazy_antiprefs = LAZY_ANTIPREFS and SOLVER_MODE == 'mip' and BACKENDS[SOLVER].supports_lazy
+if LAZY_ANTIPREFS and not lazy_antiprefs:
+    print("LAZY_ANTIPREFS needs SOLVER_MODE 'mip' and a backend with lazy callbacks (gurobi), "
+          "building every anti-preference row")
+# Everything the compiled instance depends on besides the data files
+model_options = dict(lazy_antiprefs=lazy_antiprefs, antipref_cliques=ANTIPREF_CLIQUES,
+                     max_cost=MAX_PREF_COST)
+cache_constants = dict(PROJECT_NAMES=PROJECT_NAMES, SURVEY_PROJECT_COLS=SURVEY_PROJECT_COLS,
+                       minstaff_projects=minstaff_projects, maxstaff_projects=maxstaff_projects,
+                       LOCKED_STUDENTS=LOCKED_STUDENTS, BARRED_STUDENTS=BARRED_STUDENTS, CITIZEN_REQ=CITIZEN_REQ,
+                       VISA_REQ=VISA_REQ, penalty_dict=penalty_dict, MIN_GPA=MIN_GPA, ANTIPREF_COST=ANTIPREF_COST,
+                       GPA_COST=GPA_COST, model_options=model_options,
+                       # names are resolved to students with these
+                       NAME_CUTOFF=NAME_CUTOFF, ALIAS_OVERRIDES=alias_store.overrides() if ALIAS_TABLE else None)
+instance_key = cache_key([SURVEY_FILE, STUDENT_FILE], cache_constants)
+cached = load_instance(instance_key) if COMPILE_CACHE else None
+
+if cached is not None:
+    print('Loaded compiled instance {key} from {dir}'.format(key=instance_key, dir=CACHE_DIR))
+    instance, model = cached
+    penalties = instance['penalties']
+    antiprefs_dict_1 = dict(instance['antiprefs_1'].tolist())
+    antiprefs_dict_2 = dict(instance['antiprefs_2'].tolist())
+    stu_gpa_indic = instance['gpa_indic'].tolist()
+else:
+    # Preferences mapped to penalties, one row per student
+    penalties = cohort.penalties
+    #print(penalties)
+
+    metrics.begin('antiprefs')
+    # Create dictionary of antiprefs:
+    # Index of token (student shooting bullet) to index of token (student receiving bullet)
+    # All bullets are resolved to students in one pass (see antipref_resolution.py)
+    antipref_edges = resolve_bullets(cohort.bullets, name_fuzzy, token_index, NAME_WORKERS, alias_store)
+    if ALIAS_TABLE:
+        alias_store.save()
+        print(alias_store.summary())
+    antiprefs_dict_1 = {}
+    antiprefs_dict_2 = {}
+    for (shooter, target, slot) in antipref_edges[['shooter', 'target', 'slot']].tolist():
+        if slot == 0:
+            antiprefs_dict_1[shooter] = target
+        else:
+            antiprefs_dict_2[shooter] = target
+    for edge in antipref_edges[antipref_edges['ambiguous']]:
+        print('Warning: anti-preference {name!r} of {token} matched {match} with ratio {ratio:.2f}, '
+              'but other students are as close'.format(name=cohort.bullets[edge['shooter'], edge['slot']],
+                                                       token=tokens[edge['shooter']],
+                                                       match=tokens[edge['target']], ratio=edge['ratio']))
+
+    metrics.begin('constraints')
+    # Get student GPAs and mark if below MIN_GPA
+    stu_gpas_np = cohort.gpas
+    # Optionally alter MIN_GPA to 10th percentile of GPAs
+    #MIN_GPA = np.percentile(stu_gpas_np, 10)
+    stu_gpa_indic = [1 if indiv_gpa <= MIN_GPA else 0 for indiv_gpa in stu_gpas_np]
+
+    # Add non-citizens or visa holder banned assignments
+    citizen_bans = []
+    #for token in tokens:
+    #    # Obtain citizenship and visa status
+    #    ctzn_status = df_student.at[token, 'Citizenship Description']
+    #    visa_status = df_student.at[token, 'Visa Description']
+    #    # If not a citizen then ban from citizenship required projects
+    #    if ctzn_status != 'UNITED STATES':
+    #        for project in CITIZEN_REQ:
+    #            citizen_bans.append((token,project))
+    #    if (ctzn_status != 'UNITED STATES') and (visa_status != 'Blank'):
+    #        for project in VISA_REQ:
+    #            citizen_bans.append((token,project))
 
 ######################### Find Top Assignments using the IP ###########################
             
-# utilize while loop to find solutions without duplicates
-# counter initialized to 0, the actual optimization done in optimizeIP_repeat.py
+# utilize the cut loop to find solutions without duplicates
+# counter initialized to 0, the model is built in optimizeIP_matrix.py
 soln_time = time.time()
+metrics.run = soln_time
+metrics.begin('build')
 count_solutions = 0
 past_solns = []
 scores = []
-prob, stu_to_proj = optimize_repeat(project_index, token_index, name_fuzzy, penalties, minstaff_projects, maxstaff_projects,
-                                antiprefs_dict_1, antiprefs_dict_2, stu_gpa_indic, LOCKED_STUDENTS,
-                                BARRED_STUDENTS,citizen_bans)
+if cached is None:
+    model = build_matrix_model(project_index, token_index, name_fuzzy, penalties, minstaff_projects,
+                               maxstaff_projects, antiprefs_dict_1, antiprefs_dict_2, stu_gpa_indic,
+                               LOCKED_STUDENTS, BARRED_STUDENTS, citizen_bans, **model_options)
+    if COMPILE_CACHE:
+        save_instance(instance_key, {'penalties': penalties,
+                                     'antiprefs_1': np.array(list(antiprefs_dict_1.items()), dtype=int).reshape(-1, 2),
+                                     'antiprefs_2': np.array(list(antiprefs_dict_2.items()), dtype=int).reshape(-1, 2),
+                                     'gpa_indic': stu_gpa_indic,
+                                     'minstaff': [minstaff_projects[name] for name in PROJECT_NAMES],
+                                     'maxstaff': [maxstaff_projects[name] for name in PROJECT_NAMES]}, model)
+metrics.record_model(model)
+lazy = LazyAntiprefs(model) if lazy_antiprefs else None
+backend = get_backend(SOLVER, threads=SOLVER_THREADS, time_limit=SOLVER_TIME_LIMIT, mip_gap=SOLVER_MIP_GAP)
+
+# side-constraint-free models are transportation problems
+metrics.begin('flow')
+first_result = solve_flow(model) if FLOW_FAST_PATH else None
+if first_result is not None:
+    print('No side constraints, optimal solution found by min-cost flow')
+
+# each solution is cut off from the model before the next solve
+metrics.begin('enumerate')
+budget = TimeBudget(TIME_BUDGET, max_solve_time=SOLVER_TIME_LIMIT) if TIME_BUDGET is not None else None
+if SOLVER_MODE == 'lagrangian':
+    result = first_result or solve_lagrangian(model, time_limit=SOLVER_TIME_LIMIT if budget is None
+                                              else budget.solve_limit(1))
+    if result.has_solution:
+        print('Lagrangian relaxation: value {value}, lower bound {bound}, gap {gap:.2%}'.format(
+            value=result.obj_value, bound=result.bound, gap=result.gap))
+        solutions = [(model.assignment(result.x), result)]
+    else:
+        print('No solution found, status: ' + result.status)
+        solutions = []
+elif SOLVER_MODE == 'lp':
+    result = first_result or solve_lp_rounding(model)
+    if result.has_solution:
+        print('LP rounding: value {value}, LP bound {bound}, gap {gap:.2%}'.format(
+            value=result.obj_value, bound=result.bound, gap=result.gap))
+        solutions = [(model.assignment(result.x), result)]
+    else:
+        print('No solution found, status: ' + result.status)
+        solutions = []
+elif SOLVER_MODE == 'diverse':
+    solutions = diverse_loop(model, backend, DIVERSE_LIMIT, DIVERSE_GAP, incremental=INCREMENTAL_SOLVE,
+                             first=first_result, budget=budget)
+elif KBEST_WORKERS is not None and lazy is None and MIN_DISTANCE == 1:
+    solutions = kbest(model, backend, SOLUTION_LIMIT, workers=KBEST_WORKERS, first=first_result, budget=budget)
+elif SOLUTION_POOL:
+    solutions = pool_loop(model, backend, SOLUTION_LIMIT, incremental=INCREMENTAL_SOLVE, first=first_result,
+                          lazy=lazy, min_distance=MIN_DISTANCE, budget=budget)
+else:
+    solutions = cut_loop(model, backend, SOLUTION_LIMIT, incremental=INCREMENTAL_SOLVE, first=first_result,
+                         lazy=lazy, min_distance=MIN_DISTANCE, budget=budget)
+diverse_set = StreamingDiverseSet(DIVERSE_LIMIT, DIVERSE_OBJECTIVE, DIVERSITY_METRIC) if STREAMING_DIVERSITY else None
+for assignment, result in metrics.timed_solutions(until_interrupted(solutions)):
 
-while count_solutions != SOLUTION_LIMIT:
-    prob.solve(solver='gurobi', verbose=False)
-    
     # optimal value of objective function
-    obj_val = int(prob.obj_value())
+    obj_val = int(round(result.obj_value))
+
+    # assignment vector: project index of each student
+    soln_assignment = assignment.tolist()
     scores.append(obj_val)
 
     # create a new solution file txt
@@ -206,6 +374,10 @@ while count_solutions != SOLUTION_LIMIT:
 
     f.write('soln_{number}_{score}_{date}.txt'.format(number=count_solutions+1,score=obj_val, date=soln_time))
     f.write('\n')
+    # how far from optimal this solution may be, when the solve proved a bound
+    if result.bound is not None:
+        f.write('Objective {value:g}, proven lower bound {bound:g} ({status}, gap {gap:.2%})'.format(
+            value=result.obj_value, bound=result.bound, status=result.status, gap=result.gap) + '\n')
 
     # list of strings containing warnings about skill coverage on project
     skill_warnings = []
@@ -213,9 +385,6 @@ while count_solutions != SOLUTION_LIMIT:
     # list of role coverage per project, values range 1-4
     role_coverage = []
 
-    # create assignment vector
-    soln_assignment = [1 for _ in range(num_students)] 
-
     # loop to write data in tabular format
     for j in range(num_projects):
         f.write('\n' + '>> ' + PROJECT_NAMES[j] + ' ({index})'.format(index=j+1) + '\n')
@@ -235,17 +404,16 @@ while count_solutions != SOLUTION_LIMIT:
 
         # write student info on the project and checks skills/roles
         for i in range(num_students):
-            if stu_to_proj[i, j].value[0] == 1:
-                soln_assignment[i] = j
+            if soln_assignment[i] == j:
                 curr_token = tokens[i]
                 antipref_str = '\u005B'
                 if i in antiprefs_dict_1:
                     name1 = df_survey.at[curr_token,'bullets [1]']
-                    if stu_to_proj[token_index[name_fuzzy[name1]],j].value[0] == 1:
+                    if soln_assignment[antiprefs_dict_1[i]] == j:
                         antipref_str += name1
                     if i in antiprefs_dict_2:
                         name2 = df_survey.at[curr_token,'bullets [2]']
-                        if stu_to_proj[token_index[name_fuzzy[name2]],j].value[0] == 1:
+                        if soln_assignment[antiprefs_dict_2[i]] == j:
                             antipref_str += ","+name2
                 antipref_str += '\u005D'
                 f.write(str(df_survey.at[curr_token,SURVEY_PROJECT_COLS[j]]) + ' ' # preference code
@@ -339,81 +507,54 @@ while count_solutions != SOLUTION_LIMIT:
     f.close()
 
     past_solns.append(soln_assignment)
-    prob.add_constraint(sum([stu_to_proj[i,soln_assignment[i]] for i in range(num_students)]) <= num_students-1)
+    if diverse_set is not None:
+        diverse_set.add(count_solutions, assignment)
     count_solutions += 1
 
-# initialize a pairwise distance matrix after solutions are collected
-dist_mtrx = np.zeros((SOLUTION_LIMIT,SOLUTION_LIMIT),dtype=int)
-# use past solutions to create a distance matrix between allocation solutions
-for r in range(SOLUTION_LIMIT):
-    for c in range(r+1,SOLUTION_LIMIT):
-        # find pairwise differences using the x matrices for each allocation
-        differences = 0
-        for i in range(num_students):
-            if past_solns[r][i] != past_solns[c][i]:
-                differences += 1
-        dist_mtrx[r][c] = differences
-        dist_mtrx[c][r] = differences # upper triangular matrix mirrored to make symmetric matrix
-#print(dist_mtrx)
-
-# find the most diverse solutions based on the distance matrix
-# methodology is to pick solution with largest pairwise distances to those
-# solutions already chosen
-count_div_soln = 0
-div_soln_indices = []
-while count_div_soln < DIVERSE_LIMIT:
-
-    # if we are to choose our first solution
-    if count_div_soln == 0:
-        # sums over rows
-        sums = np.sum(dist_mtrx, axis = 0).tolist()
-        # max sum over this new array
-        first_soln = sums.index(max(sums))
-        obj_val = scores[first_soln]
-        div_soln_indices.append(first_soln)
-        # start copying
-        g = open('Results/soln_{number}_{score}_{date}.txt'.format(number=first_soln+1,
-                                                              score=obj_val,
-                                                              date=soln_time),'r')
-
-        f = open('DivResults/div_soln_{number}_{score}_{date}.txt'.format(number=count_div_soln+1,score=obj_val,
-                                                              date=soln_time),'w+')
-        for line in g:
-            f.write(line)
-        g.close()
-        print('Diverse solution saved as file ' +
-              'DivResults/div_soln_{number}_{score}_{date}.txt'.format(number=count_div_soln+1,
-                                                               score=obj_val,
-                                                               date=soln_time))
-        f.close()
-        
-    # all other solutions rely on counting max sum of diff from previous chosen solutions
-    else:
-        check_sum = []
-        actual_sum = []
-        for soln_check in range(SOLUTION_LIMIT):
-            each_sum = 0
-            for soln in div_soln_indices:
-                each_sum += dist_mtrx[soln,soln_check]
-            actual_sum.append(each_sum)
-            if soln_check not in div_soln_indices:
-                check_sum.append(each_sum)
-
-        new_div_soln_index = actual_sum.index(max(check_sum))
-        obj_val = scores[new_div_soln_index]
-        div_soln_indices.append(new_div_soln_index)
-        g = open('Results/soln_{number}_{score}_{date}.txt'.format(number=new_div_soln_index+1,
-                                                            score=obj_val, date=soln_time),'r')
-
-        f = open('DivResults/div_soln_{number}_{score}_{date}.txt'.format(number=new_div_soln_index+1,score=obj_val,
-                                                              date=soln_time),'w+')
-        for line in g:
-            f.write(line)
-        g.close()
-        print('Diverse solution saved as file ' +
-              'DivResults/div_soln_{number}_{score}_{date}.txt'.format(number=new_div_soln_index+ 1,
-                                                               score=obj_val,
-                                                               date=soln_time))
-        f.close()
-    count_div_soln += 1
+if lazy is not None:
+    print(lazy.summary())
+if budget is not None:
+    print(budget.summary())
+
+metrics.begin('diversity')
+if diverse_set is not None:
+    # the diverse set was kept during enumeration
+    print(diverse_set.summary())
+    div_soln_indices = sorted(diverse_set.indices)
+else:
+    # pool of solutions as a K x num_students array of project indices
+    past_solns = np.array(past_solns, dtype=int).reshape(count_solutions, num_students)
+    # pairwise distance matrix between allocation solutions
+    dist_mtrx = distance_matrix(past_solns, DIVERSITY_METRIC, DISTANCE_BLOCK_SIZE)
+    #print(dist_mtrx)
+
+    # find the most diverse solutions based on the distance matrix
+    # methodology is to pick solution with largest pairwise distances to those
+    # solutions already chosen
+    selector = DiverseSelector(dist_mtrx, DIVERSE_OBJECTIVE, costs=scores, cost_weight=DIVERSE_COST_WEIGHT)
+    div_soln_indices = selector.select(DIVERSE_LIMIT)
+for div_soln_index in div_soln_indices:
+    obj_val = scores[div_soln_index]
+    # copy the chosen solution file
+    g = open('Results/soln_{number}_{score}_{date}.txt'.format(number=div_soln_index+1,
+                                                          score=obj_val, date=soln_time),'r')
+
+    f = open('DivResults/div_soln_{number}_{score}_{date}.txt'.format(number=div_soln_index+1,score=obj_val,
+                                                          date=soln_time),'w+')
+    for line in g:
+        f.write(line)
+    g.close()
+    print('Diverse solution saved as file ' +
+          'DivResults/div_soln_{number}_{score}_{date}.txt'.format(number=div_soln_index+1,
+                                                           score=obj_val,
+                                                           date=soln_time))
+    f.close()
 
+# cuts and lazy rows added during the enumeration
+metrics.end()
+metrics.record_model(model, 'final model')
+metrics.info.update(solver=SOLVER, solver_mode=SOLVER_MODE, solution_limit=SOLUTION_LIMIT,
+                    num_students=num_students, num_projects=num_projects,
+                    name_cache_hits=name_fuzzy.cache_hits, name_cache_misses=name_fuzzy.cache_misses)
+print('Metrics saved as file ' + metrics.write())
+print(metrics.summary())
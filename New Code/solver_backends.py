@@ -0,0 +1,491 @@
+"""
+Solver backends for MatrixModel instances (see optimizeIP_matrix.py)
+
+Every backend takes the same parameters:
+    threads     number of solver threads (None for the solver default)
+    time_limit  wall time limit per solve in seconds (None for no limit)
+    mip_gap     relative MIP gap at which to stop (None for the solver default)
+
+and returns a SolveResult from solve(model). open_session(model) returns
+a Session for solving a model repeatedly while rows are added to it;
+HiGHS and Gurobi keep one live solver model and warm start it, the
+others rebuild on every solve. Backends with supports_pool also return
+the K best distinct solutions of one branch-and-bound run from
+solve_pool(model, size). The package of a backend is only imported
+when it is used, so any one of them is enough to solve with; PICOS and
+CVXOPT are needed in any case, as optimizeIP_matrix.py imports them.
+The backends are:
+    highs   HiGHS through highspy (default, open source)
+    cbc     COIN-OR CBC through PuLP (open source)
+    glpk    GLPK through PICOS, as in team_assignment/optimize_teams.R
+    gurobi  Gurobi through gurobipy (needs a license)
+"""
+
+import time
+import numpy as np
+
+DEFAULT_BACKEND = 'highs'
+
+
+class SolveResult(object):
+    """Outcome of a single solve
+
+    status is one of 'optimal', 'feasible' (stopped at a limit with an
+    incumbent), 'infeasible' or 'no_solution' (stopped at a limit
+    without one). x is the column vector, None without a solution.
+    """
+
+    def __init__(self, status, x=None, obj_value=None, bound=None, node_count=None, solve_time=None):
+        self.status = status
+        self.x = x
+        self.obj_value = obj_value
+        self.bound = bound
+        self.node_count = node_count
+        self.solve_time = solve_time
+
+    @property
+    def has_solution(self):
+        return self.x is not None
+
+    @property
+    def gap(self):
+        """Relative gap between the incumbent and the proven bound"""
+        if self.obj_value is None or self.bound is None:
+            return None
+        return abs(self.obj_value - self.bound)/max(abs(self.obj_value), 1e-10)
+
+
+class Backend(object):
+    """Base class for solver backends"""
+
+    name = None
+    supports_pool = False
+    # whether sessions take a lazy_antiprefs.LazyAntiprefs as a solver callback
+    supports_lazy = False
+
+    def __init__(self, threads=None, time_limit=None, mip_gap=None):
+        self.threads = threads
+        self.time_limit = time_limit
+        self.mip_gap = mip_gap
+
+    @classmethod
+    def available(cls):
+        """Whether the solver package can be imported"""
+        try:
+            cls._import()
+        except ImportError:
+            return False
+        return True
+
+    @staticmethod
+    def _import():
+        raise NotImplementedError
+
+    def solve(self, model):
+        raise NotImplementedError
+
+    def open_session(self, model):
+        """Returns a Session for repeated solves of model"""
+        return Session(self, model)
+
+    def solve_pool(self, model, size):
+        """Returns SolveResults for the size best solutions, best first
+
+        Only the first, and others tied with the proven bound, are optimal;
+        the rest are feasible.
+        """
+        raise NotImplementedError('%s has no solution pool' % self.name)
+
+
+class Session(object):
+    """Solves a MatrixModel repeatedly as rows are added to it
+
+    This default session rebuilds the solver model on every solve and
+    ignores MIP starts. Backends with a modifiable live model subclass it
+    and push only what changed in the MatrixModel since the last solve:
+    new rows, variable bounds and objective coefficients.
+    """
+
+    def __init__(self, backend, model):
+        self.backend = backend
+        self.model = model
+        self.start = None
+        # lazy_antiprefs.LazyAntiprefs for backends with supports_lazy
+        self.lazy = None
+
+    def set_start(self, x):
+        """Sets a feasible column vector as MIP start for the next solve"""
+        self.start = x
+
+    def solve(self):
+        self.start = None
+        return self.backend.solve(self.model)
+
+
+class _LiveSession(Session):
+    """Tracks which rows, bounds and costs the live solver model has"""
+
+    def __init__(self, backend, model):
+        super(_LiveSession, self).__init__(backend, model)
+        self.num_rows = model.num_rows
+        self.lb = model.lb.copy()
+        self.ub = model.ub.copy()
+        self.obj = model.obj.copy()
+
+    def _changes(self):
+        """Returns the new rows and the columns whose bounds or costs changed"""
+        model = self.model
+        new_rows = np.arange(self.num_rows, model.num_rows)
+        bound_cols = np.flatnonzero((model.lb != self.lb) | (model.ub != self.ub))
+        cost_cols = np.flatnonzero(model.obj != self.obj)
+        self.num_rows = model.num_rows
+        self.lb = model.lb.copy()
+        self.ub = model.ub.copy()
+        self.obj = model.obj.copy()
+        return new_rows, bound_cols, cost_cols
+
+
+class HighsBackend(Backend):
+    """HiGHS through highspy"""
+
+    name = 'highs'
+
+    @staticmethod
+    def _import():
+        import highspy
+        return highspy
+
+    def _build(self, model):
+        highspy = self._import()
+        h = highspy.Highs()
+        h.setOptionValue('output_flag', False)
+        if self.threads is not None:
+            h.setOptionValue('threads', int(self.threads))
+        if self.time_limit is not None:
+            h.setOptionValue('time_limit', float(self.time_limit))
+        if self.mip_gap is not None:
+            h.setOptionValue('mip_rel_gap', float(self.mip_gap))
+
+        A = model.A.tocsc()
+        lp = highspy.HighsLp()
+        lp.num_col_ = model.num_vars
+        lp.num_row_ = model.num_rows
+        lp.col_cost_ = model.obj
+        lp.offset_ = model.obj_offset
+        lp.col_lower_ = model.lb
+        lp.col_upper_ = model.ub
+        lp.row_lower_ = model.row_lo
+        lp.row_upper_ = model.row_hi
+        lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+        lp.a_matrix_.start_ = A.indptr
+        lp.a_matrix_.index_ = A.indices
+        lp.a_matrix_.value_ = A.data
+        lp.integrality_ = [highspy.HighsVarType.kInteger]*model.num_vars
+        h.passModel(lp)
+        return h
+
+    def _result(self, h, start):
+        highspy = self._import()
+        status = h.getModelStatus()
+        info = h.getInfo()
+        x = None
+        if info.primal_solution_status == 2:
+            x = np.array(h.getSolution().col_value)
+        if status == highspy.HighsModelStatus.kOptimal:
+            status_str = 'optimal'
+        elif status == highspy.HighsModelStatus.kInfeasible:
+            status_str = 'infeasible'
+        elif x is not None:
+            status_str = 'feasible'
+        else:
+            status_str = 'no_solution'
+        return SolveResult(status_str, x, info.objective_function_value if x is not None else None,
+                           info.mip_dual_bound, info.mip_node_count, time.time() - start)
+
+    def solve(self, model):
+        start = time.time()
+        h = self._build(model)
+        h.run()
+        return self._result(h, start)
+
+    def open_session(self, model):
+        return HighsSession(self, model)
+
+    def write_model(self, model, path):
+        """Writes model to an MPS or LP file, by extension"""
+        self._build(model).writeModel(path)
+
+
+class HighsSession(_LiveSession):
+    """Keeps one Highs instance and appends rows to it"""
+
+    def __init__(self, backend, model):
+        super(HighsSession, self).__init__(backend, model)
+        self.h = backend._build(model)
+
+    def solve(self):
+        start = time.time()
+        model = self.model
+        new_rows, bound_cols, cost_cols = self._changes()
+        if len(new_rows) > 0:
+            A_new = model.A[new_rows].tocsr()
+            self.h.addRows(len(new_rows), model.row_lo[new_rows], model.row_hi[new_rows], A_new.nnz,
+                           A_new.indptr[:-1].astype(np.int32), A_new.indices.astype(np.int32), A_new.data)
+        if len(bound_cols) > 0:
+            self.h.changeColsBounds(len(bound_cols), bound_cols.astype(np.int32),
+                                    model.lb[bound_cols], model.ub[bound_cols])
+        if len(cost_cols) > 0:
+            self.h.changeColsCost(len(cost_cols), cost_cols.astype(np.int32), model.obj[cost_cols])
+        # the backend's limits may change between solves (see time_budget.py)
+        self.h.setOptionValue('time_limit', float(self.backend.time_limit)
+                              if self.backend.time_limit is not None else np.inf)
+        if self.start is not None:
+            self.h.setSolution(model.num_vars, np.arange(model.num_vars, dtype=np.int32),
+                               np.asarray(self.start, dtype=float))
+            self.start = None
+        self.h.run()
+        return self.backend._result(self.h, start)
+
+
+class CbcBackend(Backend):
+    """COIN-OR CBC through PuLP's bundled binary"""
+
+    name = 'cbc'
+
+    @staticmethod
+    def _import():
+        import pulp
+        return pulp
+
+    def solve(self, model):
+        pulp = self._import()
+        start = time.time()
+        prob = pulp.LpProblem('teams', pulp.LpMinimize)
+        columns = [pulp.LpVariable('x%d' % k, lowBound=model.lb[k], upBound=model.ub[k], cat='Integer')
+                   for k in range(model.num_vars)]
+        prob += pulp.LpAffineExpression([(columns[k], model.obj[k]) for k in np.flatnonzero(model.obj)])
+        A = model.A.tocsr()
+        for r in range(model.num_rows):
+            row = slice(A.indptr[r], A.indptr[r+1])
+            expr = pulp.LpAffineExpression([(columns[k], v) for (k, v) in zip(A.indices[row], A.data[row])])
+            lo, hi = model.row_lo[r], model.row_hi[r]
+            if lo == hi:
+                prob += expr == hi
+            else:
+                if np.isfinite(hi):
+                    prob += expr <= hi
+                if np.isfinite(lo):
+                    prob += expr >= lo
+
+        solver = pulp.PULP_CBC_CMD(msg=False, threads=self.threads, timeLimit=self.time_limit,
+                                   gapRel=self.mip_gap)
+        prob.solve(solver)
+        x = None
+        if prob.sol_status in (pulp.LpSolutionOptimal, pulp.LpSolutionIntegerFeasible):
+            x = np.array([column.varValue for column in columns], dtype=float)
+        if prob.sol_status == pulp.LpSolutionOptimal:
+            status = 'optimal'
+        elif prob.sol_status == pulp.LpSolutionIntegerFeasible:
+            status = 'feasible'
+        elif prob.sol_status == pulp.LpSolutionInfeasible:
+            status = 'infeasible'
+        else:
+            status = 'no_solution'
+        obj_value = model.objective(x) if x is not None else None
+        return SolveResult(status, x, obj_value, None, None, time.time() - start)
+
+
+class GlpkBackend(Backend):
+    """GLPK through PICOS (GLPK is single-threaded, threads is ignored)"""
+
+    name = 'glpk'
+
+    @staticmethod
+    def _import():
+        import swiglpk
+        from picos.modeling import solution
+        return solution
+
+    def solve(self, model):
+        pic = self._import()
+        from optimizeIP_matrix import to_picos
+        start = time.time()
+        prob, _ = to_picos(model)
+        options = {'solver': 'glpk', 'verbosity': 0, 'primals': None}
+        if self.time_limit is not None:
+            options['timelimit'] = self.time_limit
+        if self.mip_gap is not None:
+            options['rel_bnb_opt_tol'] = self.mip_gap
+        solution = prob.solve(**options)
+        columns = prob.variables['x']
+        x = None
+        if solution.primalStatus == pic.SS_OPTIMAL or solution.primalStatus == pic.SS_FEASIBLE:
+            x = np.array(columns.value, dtype=float).ravel()
+        if solution.problemStatus == pic.PS_INFEASIBLE:
+            status = 'infeasible'
+        elif x is None:
+            status = 'no_solution'
+        elif solution.claimedStatus == pic.SS_OPTIMAL:
+            status = 'optimal'
+        else:
+            status = 'feasible'
+        obj_value = model.objective(x) if x is not None else None
+        return SolveResult(status, x, obj_value, None, None, time.time() - start)
+
+
+class GurobiBackend(Backend):
+    """Gurobi through gurobipy's matrix interface"""
+
+    name = 'gurobi'
+    supports_pool = True
+    supports_lazy = True
+
+    @staticmethod
+    def _import():
+        import gurobipy
+        return gurobipy
+
+    def _build(self, model):
+        gp = self._import()
+        env = gp.Env(empty=True)
+        env.setParam('OutputFlag', 0)
+        env.start()
+        m = gp.Model('teams', env=env)
+        if self.threads is not None:
+            m.Params.Threads = int(self.threads)
+        if self.time_limit is not None:
+            m.Params.TimeLimit = float(self.time_limit)
+        if self.mip_gap is not None:
+            m.Params.MIPGap = float(self.mip_gap)
+        x = m.addMVar(model.num_vars, lb=model.lb, ub=model.ub, obj=model.obj, vtype=gp.GRB.BINARY)
+        m.ObjCon = model.obj_offset
+
+        A = model.A.tocsr()
+        lo, hi = model.row_lo, model.row_hi
+        equal = lo == hi
+        for rows, sense, rhs in ((np.flatnonzero(equal), '=', hi),
+                                 (np.flatnonzero(~equal & np.isfinite(hi)), '<', hi),
+                                 (np.flatnonzero(~equal & np.isfinite(lo)), '>', lo)):
+            if len(rows) > 0:
+                m.addMConstr(A[rows], x, sense, rhs[rows])
+        return m, x
+
+    def _result(self, m, x, start):
+        gp = self._import()
+        solution = np.array(x.X) if m.SolCount > 0 else None
+        if m.Status == gp.GRB.OPTIMAL:
+            status = 'optimal'
+        elif m.Status in (gp.GRB.INFEASIBLE, gp.GRB.INF_OR_UNBD):
+            status = 'infeasible'
+        elif solution is not None:
+            status = 'feasible'
+        else:
+            status = 'no_solution'
+        return SolveResult(status, solution, m.ObjVal if solution is not None else None,
+                           m.ObjBound if status in ('optimal', 'feasible') else None,
+                           int(m.NodeCount), time.time() - start)
+
+    def solve(self, model):
+        start = time.time()
+        m, x = self._build(model)
+        m.optimize()
+        return self._result(m, x, start)
+
+    def open_session(self, model):
+        return GurobiSession(self, model)
+
+    def solve_pool(self, model, size):
+        start = time.time()
+        m, x = self._build(model)
+        # systematic search for the size best solutions
+        m.Params.PoolSearchMode = 2
+        m.Params.PoolSolutions = size
+        m.optimize()
+        best = self._result(m, x, start)
+        if not best.has_solution:
+            return [best]
+        results = []
+        for k in range(m.SolCount):
+            m.Params.SolutionNumber = k
+            value = m.PoolObjVal
+            # only the incumbent, and pool members tied with the proven bound, are optimal
+            optimal = best.status == 'optimal' and (k == 0 or value <= best.bound + 1e-9)
+            results.append(SolveResult('optimal' if optimal else 'feasible', np.array(x.Xn), value, best.bound,
+                                       best.node_count, best.solve_time))
+        return results
+
+
+class GurobiSession(_LiveSession):
+    """Keeps one Gurobi model and appends rows to it"""
+
+    def __init__(self, backend, model):
+        super(GurobiSession, self).__init__(backend, model)
+        self.m, self.x = backend._build(model)
+
+    def solve(self):
+        start = time.time()
+        model = self.model
+        new_rows, bound_cols, cost_cols = self._changes()
+        if len(new_rows) > 0:
+            A_new = model.A[new_rows].tocsr()
+            lo, hi = model.row_lo[new_rows], model.row_hi[new_rows]
+            equal = lo == hi
+            for rows, sense, rhs in ((np.flatnonzero(equal), '=', hi),
+                                     (np.flatnonzero(~equal & np.isfinite(hi)), '<', hi),
+                                     (np.flatnonzero(~equal & np.isfinite(lo)), '>', lo)):
+                if len(rows) > 0:
+                    self.m.addMConstr(A_new[rows], self.x, sense, rhs[rows])
+        if len(bound_cols) > 0:
+            self.x[bound_cols].LB = model.lb[bound_cols]
+            self.x[bound_cols].UB = model.ub[bound_cols]
+        if len(cost_cols) > 0:
+            self.x[cost_cols].Obj = model.obj[cost_cols]
+        # the backend's limits may change between solves (see time_budget.py)
+        self.m.Params.TimeLimit = (float(self.backend.time_limit) if self.backend.time_limit is not None
+                                   else self.backend._import().GRB.INFINITY)
+        if self.start is not None:
+            self.x.Start = np.asarray(self.start, dtype=float)
+            self.start = None
+        if self.lazy is None:
+            self.m.optimize()
+            return self.backend._result(self.m, self.x, start)
+
+        # add violated anti-preference rows from inside branch and bound
+        gp = self.backend._import()
+        lazy = self.lazy
+        columns = self.x.tolist()
+        separated = []
+
+        def callback(m, where):
+            if where != gp.GRB.Callback.MIPSOL:
+                return
+            rows = lazy.violated_rows(np.array(m.cbGetSolution(columns)))
+            if rows is None:
+                return
+            A, lo, hi = rows
+            for r in range(A.shape[0]):
+                cols = A.indices[A.indptr[r]:A.indptr[r+1]]
+                expr = gp.LinExpr(A.data[A.indptr[r]:A.indptr[r+1]].tolist(), [columns[c] for c in cols])
+                m.cbLazy(expr <= hi[r])
+            separated.append((A, lo, hi))
+
+        self.m.Params.LazyConstraints = 1
+        self.m.optimize(callback)
+        result = self.backend._result(self.m, self.x, start)
+        # callback rows only last for this run, so they become model rows for the next solve
+        for (A, lo, hi) in separated:
+            lazy.record(A, lo, hi)
+        return result
+
+
+BACKENDS = {'highs': HighsBackend,
+            'cbc': CbcBackend,
+            'glpk': GlpkBackend,
+            'gurobi': GurobiBackend}
+
+
+def get_backend(name=DEFAULT_BACKEND, threads=None, time_limit=None, mip_gap=None):
+    """Returns a backend instance by name"""
+    if name not in BACKENDS:
+        raise ValueError("unknown solver backend '%s', choose from %s" % (name, sorted(BACKENDS.keys())))
+    return BACKENDS[name](threads=threads, time_limit=time_limit, mip_gap=mip_gap)
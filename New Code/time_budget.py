@@ -0,0 +1,72 @@
+import time
+
+"""
+Time budget for a whole enumeration
+
+A single hard solve without a time limit can hold up every solution
+after it. A TimeBudget is a total wall time for all solves of a run;
+before each solve the enumeration loops in enumerate_solutions.py ask it
+for that solve's time limit and stop once it is used up. The first solve
+is the hardest (later ones are warm started from the previous solution
+or skipped), so each solve may use SOLVE_SHARE of what is left, and at
+least an equal share among the solves still to come. Time left over by
+quick solves goes to the later ones. A solve that hits its limit returns
+its incumbent with the proven bound, so every solution still comes with
+how far from optimal it may be.
+"""
+
+# fraction of the remaining budget a single solve may use
+SOLVE_SHARE = 0.5
+# every solve gets at least this many seconds while any budget is left
+MIN_SOLVE_TIME = 1.0
+
+
+class TimeBudget(object):
+    """Splits a total number of seconds across the solves of an enumeration
+
+    max_solve_time caps every solve's share (e.g. the per-solve
+    SOLVER_TIME_LIMIT), None for no cap.
+    """
+
+    def __init__(self, seconds, max_solve_time=None, share=SOLVE_SHARE, min_solve_time=MIN_SOLVE_TIME):
+        self.seconds = seconds
+        self.share = share
+        self.max_solve_time = max_solve_time
+        self.min_solve_time = min_solve_time
+        self.start = time.time()
+        self.solves = 0
+        # solves stopped by their share of the budget with an incumbent
+        self.stopped = 0
+
+    def elapsed(self):
+        return time.time() - self.start
+
+    def remaining(self):
+        return max(self.seconds - self.elapsed(), 0.0)
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def solve_limit(self, solves_left):
+        """Returns the time limit for the next solve when solves_left solves are still wanted"""
+        remaining = self.remaining()
+        share = max(remaining*self.share, remaining/max(solves_left, 1), min(self.min_solve_time, remaining))
+        if self.max_solve_time is not None:
+            share = min(share, self.max_solve_time)
+        return share
+
+    def apply(self, backend, solves_left):
+        """Sets the backend's time limit for the next solve"""
+        backend.time_limit = self.solve_limit(solves_left)
+        self.solves += 1
+
+    def record(self, result):
+        """Counts a solve result that stopped at its limit with an incumbent"""
+        if result.status == 'feasible':
+            self.stopped += 1
+
+    def summary(self):
+        return ('Time budget: {elapsed:.1f} of {seconds:.1f} s used in {solves} solves, '
+                '{stopped} stopped at their limit'.format(elapsed=min(self.elapsed(), self.seconds),
+                                                           seconds=self.seconds, solves=self.solves,
+                                                           stopped=self.stopped))